@@ -5,6 +5,21 @@ TODO: Document core package
 
 from units import *
 from simulation import *
+from engine import ExecutionPlan, FusedConnections
+from parallel import ThreadedPlan
+from slab import StateSlab
+from profiler import Profiler
+from telemetry import Telemetry, JsonLinesTelemetry
+from steadystate import SteadyStateDetector
+from integrators import (NetworkIntegrator, HeunIntegrator, RK4Integrator,
+                         AdaptiveIntegrator)
 
 del units
 del simulation
+del engine
+del parallel
+del slab
+del profiler
+del telemetry
+del steadystate
+del integrators
@@ -0,0 +1,272 @@
+'''
+Module containing the ExecutionPlan class, a compiled version of the main loop
+of the Simulation.
+
+The plan is built once the simulation objects are initialized: the lists of
+connections, groups and nodes of the simulation are flattened into tuples of
+bound methods (the kernels) that are executed in the same order as in the
+regular loop of the simulation, so that the results stay identical.
+The connections may also be fused (see Simulation.run, argument
+fuseConnections), the results are then identical up to the rounding errors.
+'''
+# Standard imports
+import numpy as np
+
+__all__ = ["ExecutionPlan", "FusedConnections"]
+
+class ExecutionPlan(object):
+    '''Flat and pre-ordered list of the kernels executed at each time step.
+
+    Arguments:
+    - simulation: the Simulation instance whose objects are compiled
+
+    The plan is reused by the simulation as long as its objects are the same,
+    see method matches. The kernels that depend on arrays reallocated by the
+    initialization of the objects are re-bound with method bind before each
+    run.
+    
+    When the fusion of the connections is enabled, the incoming connections of
+    a group that can be fused (see Connection._is_fusable), undelayed and whose
+    output is not monitored, are replaced by one matrix product: their weights
+    are stacked horizontally, once per run, and multiplied by the outputs of
+    their sending groups, gathered in one vector, when the input of the group
+    is added up. The output of these connections is then not updated.
+    The other fusable connections sending from the same group with the same
+    delay are executed together, see FusedConnections.
+    '''
+
+    # False for the plans that do not fuse the connections
+    supportsFusion = True
+
+    def __init__(self, simulation):
+
+        self.simulation = simulation
+        self.signature = self.get_signature(simulation)
+        self.connections = tuple(simulation.connections)
+        self.connectionKernels = tuple([connection._execute \
+                                        for connection in self.connections])
+        self.nodeKernels = tuple([node._execute for node in simulation.nodes])
+        self.inputKernels = ()
+        self.fusedWeights = {}
+        self.step = None
+
+    @staticmethod
+    def get_signature(simulation):
+        '''Return an identifier of the objects and of their order in the
+        simulation.
+        '''
+        return (tuple([id(obj) for obj in simulation.connections]),
+                tuple([id(obj) for obj in simulation.groups]),
+                tuple([id(obj) for obj in simulation.nodes]))
+
+    def matches(self, simulation):
+        '''Return True if the plan can be reused for the simulation'''
+        return simulation is self.simulation and \
+            self.get_signature(simulation) == self.signature
+
+    def bind(self):
+        '''Bind the kernels to the arrays of the initialized objects and build
+        the step function.
+        Must be called after the initialization of the objects, each time the
+        simulation is run.
+        '''
+        simulation = self.simulation
+        self.fusedWeights = {}
+        inputKernels = []
+        fusedConnections = set()
+        for group in simulation.groups:
+            fused = []
+            if self.supportsFusion and simulation.fuseConnections:
+                fused = [connection for connection in group.incoming_Cs \
+                         if self.can_fuse_input(connection)]
+            if len(fused) > 1:
+                inputKernels.append(self.fused_input_kernel(group, fused))
+                fusedConnections.update(fused)
+            else:
+                inputKernels.append(group._input_kernel())
+        self.inputKernels = tuple(inputKernels)
+        if self.supportsFusion:
+            connections = [connection for connection in simulation.connections \
+                           if connection not in fusedConnections]
+            if simulation.fuseConnections:
+                connections = self.fuse_outputs(connections)
+            self.connections = tuple(connections)
+            self.connectionKernels = tuple([connection._execute \
+                                            for connection in self.connections])
+        self.step = self.build_step()
+
+    @staticmethod
+    def can_fuse_input(connection):
+        '''Return True if the connection can be fused with the other incoming
+        connections of its receiving group.
+        '''
+        return connection._is_fusable() and connection.delaySteps == 0 and \
+            not (connection.isMonitored and 'output' in connection.monitoredVars)
+
+    @staticmethod
+    def fuse_outputs(connections):
+        '''Return the list of the connections in which the fusable connections
+        sharing their sending group and their delay are replaced by a
+        FusedConnections, at the position of the first of them.
+        '''
+        sharing = {}
+        for connection in connections:
+            if connection._is_fusable():
+                key = (connection.sendingGroup, connection.delaySteps)
+                sharing.setdefault(key, []).append(connection)
+        fused = {}
+        for key, group in sharing.items():
+            if len(group) > 1:
+                fusedConnections = FusedConnections(group)
+                for connection in group:
+                    fused[connection] = fusedConnections
+        executed = []
+        for connection in connections:
+            if connection not in fused:
+                executed.append(connection)
+            elif fused[connection] not in executed:
+                executed.append(fused[connection])
+        return executed
+
+    def fused_input_kernel(self, group, connections):
+        '''Return a function that sets the input of the group to the product
+        of the stacked weights of the connections by the outputs of their
+        sending groups, plus the output of its other incoming connections.
+        '''
+        if not group.inPlace:
+            group.input = np.zeros(np.shape(group.input), group.dtype)
+        inputVector = group.input
+        weights = np.hstack([connection.weights for connection in connections])
+        self.fusedWeights[group] = weights
+        others = tuple([connection for connection in group.incoming_Cs \
+                        if connection not in connections])
+
+        # Position of the output of each sending group in the gathered vector
+        senders = []
+        start = 0
+        for connection in connections:
+            nbUnits = connection.sendingGroup.nbUnits
+            senders.append((connection.sendingGroup,
+                            slice(start, start + nbUnits)))
+            start += nbUnits
+        senders = tuple(senders)
+        batchShape = inputVector.shape[:-1]
+        senderOutputs = np.zeros(batchShape + (start,), weights.dtype)
+
+        # The product is written in the input vector when numpy can
+        if inputVector.flags.c_contiguous and inputVector.dtype == weights.dtype:
+            product = inputVector
+        else:
+            product = np.zeros(inputVector.shape, weights.dtype)
+        batched = len(batchShape) > 0
+        transposedWeights = weights.T
+
+        def add_up_inputs():
+            for sendingGroup, senderSlice in senders:
+                senderOutputs[..., senderSlice] = sendingGroup.output
+            if batched:
+                np.dot(senderOutputs, transposedWeights, out=product)
+            else:
+                np.dot(weights, senderOutputs, out=product)
+            if product is not inputVector:
+                inputVector[...] = product
+            for connection in others:
+                np.add(inputVector, connection.output, out=inputVector)
+
+        return add_up_inputs
+
+    def wrap_kernels(self, wrapper=None):
+        '''Return the tuples of connection, input and node kernels. If given,
+        each kernel is replaced by wrapper(kernel, owner, category), owner being
+        the object executed by the kernel and category one of 'connection',
+        'input', 'node' or 'integration'.
+        '''
+        if wrapper is None:
+            return self.connectionKernels, self.inputKernels, self.nodeKernels
+        connectionKernels = tuple([wrapper(kernel, kernel.__self__, 'connection') \
+                                   for kernel in self.connectionKernels])
+        inputKernels = tuple([wrapper(kernel, group, 'input') for kernel, group \
+                              in zip(self.inputKernels, self.simulation.groups)])
+        nodeKernels = []
+        for kernel in self.nodeKernels:
+            owner = kernel.__self__
+            if owner is self:
+                nodeKernels.append(wrapper(kernel, owner, 'integration'))
+            else:
+                nodeKernels.append(wrapper(kernel, owner, 'node'))
+        return connectionKernels, inputKernels, tuple(nodeKernels)
+
+    def build_step(self, wrapper=None):
+        '''Return the step function executing the kernels, see method
+        wrap_kernels for the wrapper argument. Must be called after method bind.
+        '''
+        connectionKernels, inputKernels, nodeKernels = \
+            self.wrap_kernels(wrapper)
+
+        def step(timeStep):
+            '''Execute one time step of the simulation'''
+            for kernel in connectionKernels:
+                kernel(timeStep)
+            for kernel in inputKernels:
+                kernel()
+            for kernel in nodeKernels:
+                kernel(timeStep)
+
+        return step
+
+class FusedConnections(object):
+    '''Connections sending from the same group with the same delay, executed
+    with one matrix product by an execution plan.
+
+    Arguments:
+    - connections: the fusable connections (see Connection._is_fusable),
+        initialized
+
+    Their weights are stacked vertically, once per run, and multiplied by the
+    output of the sending group, read in its history for delayed connections.
+    The output of each connection is a view into the result of the product,
+    updated in place at each time step.
+    '''
+
+    parallelSafe = True
+
+    def __init__(self, connections):
+
+        self.connections = tuple(connections)
+        first = self.connections[0]
+        self.name = 'fused(%s)'%', '.join([str(connection) for connection \
+                                            in self.connections])
+        self.sendingGroup = first.sendingGroup
+        self.delaySteps = first.delaySteps
+        self.senderHistory = first.senderHistory
+        self.weights = np.vstack([connection.weights for connection \
+                                  in self.connections])
+
+        batchShape = np.shape(self.sendingGroup.output)[:-1]
+        self.batched = len(batchShape) > 0
+        self.transposedWeights = self.weights.T
+        self.product = np.zeros(batchShape + (self.weights.shape[0],),
+                                self.weights.dtype)
+        start = 0
+        for connection in self.connections:
+            rows = slice(start, start + connection.weights.shape[0])
+            self.product[..., rows] = connection.output
+            connection.output = self.product[..., rows]
+            start = rows.stop
+
+    def _execution_cost(self):
+
+        return np.size(self.weights)
+
+    def _execute(self, timeStep):
+        '''Compute the output of all the connections'''
+        if self.delaySteps:
+            history = self.senderHistory
+            history.record(timeStep)
+            senderOutput = history.read(self.delaySteps)
+        else:
+            senderOutput = self.sendingGroup.output
+        if self.batched:
+            np.dot(senderOutput, self.transposedWeights, out=self.product)
+        else:
+            np.dot(self.weights, senderOutput, out=self.product)
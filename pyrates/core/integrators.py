@@ -0,0 +1,361 @@
+'''
+Module containing the network integrators, higher order alternatives to the
+Euler integration of the LeakyIntegrator groups done by the time steps of the
+simulation.
+'''
+# Standard imports
+from __future__ import division
+from warnings import warn
+import numpy as np
+
+# Local imports
+from engine import ExecutionPlan
+
+__all__ = ["NetworkIntegrator", "HeunIntegrator", "RK4Integrator",
+           "AdaptiveIntegrator"]
+
+class NetworkIntegrator(ExecutionPlan):
+    '''Base class of the explicit Runge-Kutta integrators of the network.
+
+    Arguments:
+    - simulation: the Simulation instance whose network is integrated
+
+    The LeakyIntegrator groups of the integrable nodes (see Node.integrable)
+    are integrated together, on the state slab of the simulation, with the
+    derivative of the whole network:
+        dS/dt = (input + restingState - S) / tauStep
+    evaluated at several stages of each time step. At each stage the output of
+    the integrated groups is recomputed from the stage state, and so are the
+    inputs they receive from each other through undelayed connections with a
+    linear output (see Connection.linearOutput). The other connections keep
+    the output computed at the beginning of the time step, and the other nodes
+    are executed as usual.
+
+    The method is given by its Butcher tableau, in the class attributes
+    stageCoefficients (one list per stage) and weights. It replaces the
+    integrator option of the groups (see LeakyIntegrator), a warning is given
+    for the groups whose option is not 'euler'.
+    '''
+
+    leakyIntegratorLink = None
+
+    # The integrators execute the connections themselves
+    supportsFusion = False
+
+    name = None
+    stageCoefficients = []
+    weights = []
+
+    # True for the integrators whose steps cover a variable number of time
+    # steps of the simulation, given by attribute stepLength after each step
+    adaptive = False
+
+    def __init__(self, simulation):
+
+        super(NetworkIntegrator, self).__init__(simulation)
+
+        # The integrated groups are integrated together where the first of
+        # their nodes was executed
+        self.integratedGroups = []
+        nodeKernels = []
+        for node in simulation.nodes:
+            if node.integrable and \
+                    isinstance(node.outputGroup, self.leakyIntegratorLink):
+                if self.integratedGroups == []:
+                    nodeKernels.append(self.integrate)
+                group = node.outputGroup
+                if group.integrator != 'euler':
+                    msg = "The integrator '%s' of group %s is replaced by the "\
+                        + "network integrator '%s'"
+                    warn(msg%(group.integrator, str(group), self.name))
+                self.integratedGroups.append(group)
+            else:
+                nodeKernels.append(node._execute)
+        self.nodeKernels = tuple(nodeKernels)
+
+    def bind(self):
+        '''Bind the integrator to the state slab and to the initialized objects.
+        Must be called after the creation of the state slab, each time the
+        simulation is run.
+        '''
+        super(NetworkIntegrator, self).bind()
+
+        slab = self.simulation.stateSlab
+        self.slab = slab
+        shape = slab.state.shape
+        dtype = slab.state.dtype
+        self.invTauStep = np.zeros(shape, dtype)
+        self.restingState = np.zeros(shape, dtype)
+        self.groupSlices = []
+        for group in self.integratedGroups:
+            groupSlice = slab.get_group_slice(group)
+            self.invTauStep[..., groupSlice] = group.invTauStep
+            self.restingState[..., groupSlice] = group.restingState
+            self.groupSlices.append((group, groupSlice))
+
+        # Connections recomputed at each stage, and the others whose output is
+        # kept during the time step
+        self.stageConnections = []
+        self.fixedConnections = []
+        for group, groupSlice in self.groupSlices:
+            for connection in group.incoming_Cs:
+                if connection.linearOutput and connection.delaySteps == 0 and \
+                        connection.projection is None and \
+                        connection.sendingGroup in self.integratedGroups:
+                    self.stageConnections.append((connection, groupSlice))
+                else:
+                    self.fixedConnections.append((connection, groupSlice))
+
+        self.initialState = np.zeros(shape, dtype)
+        self.stageState = np.zeros(shape, dtype)
+        self.fixedInput = np.zeros(shape, dtype)
+        self.stageInput = np.zeros(shape, dtype)
+        self.slopes = [np.zeros(shape, dtype) for i in range(len(self.weights))]
+
+    def integrate(self, timeStep):
+        '''Integrate the states of the integrated groups over one time step and
+        update their outputs.
+        '''
+        initialState = self.initialState
+        initialState[...] = self.slab.state
+
+        self.fixedInput.fill(0)
+        for connection, groupSlice in self.fixedConnections:
+            self.fixedInput[..., groupSlice] += connection.output
+
+        # The first stage uses the inputs summed up by the groups
+        firstSlope = self.slopes[0]
+        np.add(self.slab.input, self.restingState, out=firstSlope)
+        firstSlope -= initialState
+        firstSlope *= self.invTauStep
+
+        for stage in range(1, len(self.weights)):
+            stageState = self.stageState
+            stageState[...] = initialState
+            for slope, coefficient in zip(self.slopes,
+                                          self.stageCoefficients[stage]):
+                if coefficient != 0:
+                    stageState += coefficient * slope
+            self.evaluate_slope(stageState, self.slopes[stage])
+
+        state = self.slab.state
+        state[...] = initialState
+        for slope, weight in zip(self.slopes, self.weights):
+            state += weight * slope
+
+        for group, groupSlice in self.groupSlices:
+            group.output[...] = group.activationFunction(group.state)
+
+    def evaluate_slope(self, stageState, slope):
+        '''Compute in slope the derivative of the network at the stage state'''
+        for group, groupSlice in self.groupSlices:
+            group.output[...] = group.activationFunction(stageState[..., groupSlice])
+
+        stageInput = self.stageInput
+        stageInput[...] = self.fixedInput
+        for connection, groupSlice in self.stageConnections:
+            stageInput[..., groupSlice] += \
+                connection._project(connection.sendingGroup.output)
+
+        np.add(stageInput, self.restingState, out=slope)
+        slope -= stageState
+        slope *= self.invTauStep
+
+class HeunIntegrator(NetworkIntegrator):
+    '''Heun's method, a second order Runge-Kutta method'''
+
+    name = 'heun'
+    stageCoefficients = [[],
+                         [1.]]
+    weights = [1 / 2, 1 / 2]
+
+class RK4Integrator(NetworkIntegrator):
+    '''The classical fourth order Runge-Kutta method'''
+
+    name = 'rk4'
+    stageCoefficients = [[],
+                         [1 / 2],
+                         [0., 1 / 2],
+                         [0., 0., 1.]]
+    weights = [1 / 6, 1 / 3, 1 / 3, 1 / 6]
+
+class AdaptiveIntegrator(HeunIntegrator):
+    '''Heun's method with a variable step length, controlled by an estimate of
+    the local error on the states of the integrated groups.
+
+    Arguments:
+    - simulation: the Simulation instance whose network is integrated
+
+    A step covers stepLength time steps of the simulation at once, between 1
+    and the maxStepLength set with Simulation.set_adaptive_stepping. The local
+    error of the step is estimated by the difference between Heun's method and
+    the embedded Euler method, i.e. stepLength / 2 times the largest difference
+    between the two slopes of the step. A step whose error is above the
+    tolerance is done again with a shorter length, and the length of the next
+    step is adapted to the error of the accepted step.
+
+    The length of a step is also limited so that nothing but the integrated
+    groups changes during the step:
+    - the connections are executed once at the beginning of the step. Their
+        delays are read by interpolation in the history of the output of their
+        sending group (see Connection._execute_interpolated), and the
+        connections with dynamic weights limit the steps to one time step.
+    - the other nodes are executed once after the integration, with the last
+        time step covered by the step. A step ends at the latest on the next
+        time step where their output changes (see Node.get_next_change), or
+        where such a change reaches the integrated groups through a delayed
+        connection. Their delayed outputs are not interpolated.
+    - a step ends at the latest on the monitoring bounds and at the end of the
+        simulation, see Simulation.get_step_horizon. Monitors record once per
+        step.
+    '''
+
+    name = 'adaptive'
+    adaptive = True
+
+    # Bounds of the factor applied to the step length after a step
+    minLengthFactor = 0.2
+    maxLengthFactor = 2.
+    safetyFactor = 0.9
+
+    def __init__(self, simulation):
+
+        super(AdaptiveIntegrator, self).__init__(simulation)
+
+        self.otherNodes = [node for node in simulation.nodes \
+                           if node.outputGroup is None or \
+                           node.outputGroup not in self.integratedGroups]
+        self.nodeKernels = tuple([node._execute for node in self.otherNodes])
+
+    def bind(self):
+        '''Bind the integrator to the state slab and to the initialized objects.
+        Must be called after the creation of the state slab, each time the
+        simulation is run.
+        '''
+        connectionKernels = []
+        self.maxStepLength = self.simulation.maxStepLength
+        nodes = dict([(node.outputGroup, node) for node in self.otherNodes \
+                      if node.outputGroup is not None])
+        delayedNodes = []
+        for connection in self.simulation.connections:
+            if connection.dynamicWeights:
+                self.maxStepLength = 1
+            if connection.delaySteps > 0 and \
+                    connection.sendingGroup in nodes:
+                delayedNodes.append((nodes[connection.sendingGroup],
+                                     connection.delaySteps))
+            if connection.delaySteps > 0 and connection.projection is None:
+                # The outputs of the other nodes are constant between their
+                # changes, which end the steps
+                connection._start_history(
+                    interpolate=connection.sendingGroup not in nodes)
+                connectionKernels.append(connection._execute_interpolated)
+            else:
+                connectionKernels.append(connection._execute)
+        self.connectionKernels = tuple(connectionKernels)
+        # The changes of the outputs of the other nodes reach the integrated
+        # groups delaySteps time steps later through delayed connections
+        self.delayedNodes = list(set(delayedNodes))
+
+        super(AdaptiveIntegrator, self).bind()
+
+        self.tolerance = self.simulation.adaptiveTolerance
+        self.errorEstimate = np.zeros_like(self.slab.state)
+        self.stepLength = 1
+        self.nextStepLength = 1
+
+    def get_step_horizon(self, timeStep):
+        '''Return the maximum length of the step starting at timeStep'''
+        horizon = self.maxStepLength
+        simulationHorizon = self.simulation.get_step_horizon(timeStep)
+        if simulationHorizon is not None:
+            horizon = min(horizon, simulationHorizon)
+        for node in self.otherNodes:
+            change = node.get_next_change(timeStep)
+            if change is not None:
+                horizon = min(horizon, change - timeStep + 1)
+        # A change made delay time steps ago or later is still on its way
+        for node, delay in self.delayedNodes:
+            change = node.get_next_change(timeStep - delay)
+            if change is not None:
+                horizon = min(horizon, change + delay - timeStep + 1)
+        return max(horizon, 1)
+
+    def build_step(self, wrapper=None):
+        '''Return the step function executing one step of the simulation
+        starting at the time step given as argument. The number of time steps
+        covered is then given by attribute stepLength.
+        '''
+        connectionKernels, inputKernels, nodeKernels = \
+            self.wrap_kernels(wrapper)
+        integrate = self.integrate_adaptive
+        if wrapper is not None:
+            integrate = wrapper(integrate, self, 'integration')
+
+        def step(timeStep):
+            '''Execute one step of the simulation'''
+            stepLength = min(self.nextStepLength,
+                             self.get_step_horizon(timeStep))
+            for kernel in connectionKernels:
+                kernel(timeStep)
+            for kernel in inputKernels:
+                kernel()
+            stepLength = integrate(stepLength)
+            lastTimeStep = timeStep + stepLength - 1
+            for kernel in nodeKernels:
+                kernel(lastTimeStep)
+            self.stepLength = stepLength
+
+        return step
+
+    def integrate_adaptive(self, stepLength):
+        '''Integrate the states of the integrated groups over a step of at most
+        stepLength time steps, update their outputs and return the length of
+        the accepted step.
+        '''
+        initialState = self.initialState
+        initialState[...] = self.slab.state
+
+        self.fixedInput.fill(0)
+        for connection, groupSlice in self.fixedConnections:
+            self.fixedInput[..., groupSlice] += connection.output
+
+        eulerSlope, secondSlope = self.slopes
+        np.add(self.slab.input, self.restingState, out=eulerSlope)
+        eulerSlope -= initialState
+        eulerSlope *= self.invTauStep
+
+        stageState = self.stageState
+        errorEstimate = self.errorEstimate
+        while True:
+            np.multiply(eulerSlope, stepLength, out=stageState)
+            stageState += initialState
+            self.evaluate_slope(stageState, secondSlope)
+
+            np.subtract(secondSlope, eulerSlope, out=errorEstimate)
+            np.abs(errorEstimate, out=errorEstimate)
+            error = stepLength / 2 * errorEstimate.max()
+            if error > 0:
+                factor = self.safetyFactor * np.sqrt(self.tolerance / error)
+                factor = min(max(factor, self.minLengthFactor),
+                             self.maxLengthFactor)
+            else:
+                factor = self.maxLengthFactor
+            if error <= self.tolerance or stepLength == 1:
+                break
+            stepLength = max(min(int(stepLength * factor), stepLength - 1), 1)
+
+        state = self.slab.state
+        np.add(eulerSlope, secondSlope, out=state)
+        state *= stepLength / 2
+        state += initialState
+
+        for group, groupSlice in self.groupSlices:
+            group.output[...] = group.activationFunction(group.state)
+
+        nextStepLength = int(stepLength * factor)
+        if factor > 1:
+            # Short steps grow even when the factor is rounded down
+            nextStepLength = max(nextStepLength, stepLength + 1)
+        self.nextStepLength = max(nextStepLength, 1)
+        return stepLength
@@ -0,0 +1,160 @@
+'''
+Module containing the ThreadedPlan class, an execution plan running the
+independent objects of each phase of a time step on a pool of threads.
+'''
+# Standard imports
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+# Local imports
+from engine import ExecutionPlan
+
+__all__ = ["ThreadedPlan"]
+
+class ThreadedPlan(ExecutionPlan):
+    '''Execution plan running the kernels of each phase of a time step (the
+    connections, then the sums of the inputs of the groups, then the nodes)
+    on a pool of threads. The objects of a phase are independent: they only
+    read variables computed during the previous phase, and numpy releases the
+    GIL in its matrix products and ufuncs.
+
+    Arguments:
+    - simulation: the Simulation instance whose objects are compiled
+    - nbThreads: the number of threads of the pool, by default the number of
+        cores
+
+    The objects whose class attribute parallelSafe is False (e.g. the nodes
+    drawing random numbers or reading the output of other groups) are
+    executed by the main thread, in their order in the simulation, between
+    the parallel parts of the phase.
+
+    The kernels of a parallel part are grouped into at most nbThreads batches
+    of similar cost, a batch costing at least minBatchCost (e.g. the number of
+    weights of a connection), so that small objects are executed together.
+    Parts too cheap to make two batches are executed by the main thread.
+
+    The matrix products may also use several threads of the BLAS library: its
+    number of threads (e.g. OMP_NUM_THREADS) should then be reduced.
+    '''
+
+    minBatchCost = 20000
+
+    def __init__(self, simulation, nbThreads=None):
+
+        super(ThreadedPlan, self).__init__(simulation)
+        if nbThreads is None:
+            nbThreads = cpu_count()
+        self.nbThreads = nbThreads
+        self.pool = None
+
+    def bind(self):
+        '''Start the pool of threads, bind the kernels and build the step
+        function. Must be called after the initialization of the objects, each
+        time the simulation is run.
+        '''
+        if self.pool is None:
+            self.pool = ThreadPool(self.nbThreads)
+        super(ThreadedPlan, self).bind()
+
+    def close(self):
+        '''Stop the pool of threads'''
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def build_step(self, wrapper=None):
+        '''Return the step function executing the phases of the kernels, see
+        ExecutionPlan.wrap_kernels for the wrapper argument.
+        Must be called after method bind.
+        '''
+        connectionKernels, inputKernels, nodeKernels = \
+            self.wrap_kernels(wrapper)
+        simulation = self.simulation
+        connectionPhase = self.schedule(connectionKernels, self.connections,
+                                        'connection')
+        inputPhase = self.schedule(inputKernels, simulation.groups, 'input')
+        nodePhase = self.schedule(nodeKernels, simulation.nodes, 'node')
+        pool = self.pool
+
+        def run_part(part, args):
+            if len(part) == 1:
+                for kernel in part[0]:
+                    kernel(*args)
+            else:
+                pool.map(lambda batch: [kernel(*args) for kernel in batch],
+                         part)
+
+        def step(timeStep):
+            '''Execute one time step of the simulation'''
+            args = (timeStep,)
+            for part in connectionPhase:
+                run_part(part, args)
+            for part in inputPhase:
+                run_part(part, ())
+            for part in nodePhase:
+                run_part(part, args)
+
+        return step
+
+    def schedule(self, kernels, owners, category):
+        '''Split the kernels of a phase into successive parts, each part being
+        a tuple of batches of kernels executed in parallel, or a single batch
+        executed by the main thread.
+        '''
+        parts = []
+        safeKernels = []
+        safeCosts = []
+        for kernel, owner in zip(kernels, owners):
+            if getattr(owner, 'parallelSafe', True):
+                cost = estimate_cost(owner, category)
+                if category == 'input' and owner in self.fusedWeights:
+                    cost += np.size(self.fusedWeights[owner])
+                safeKernels.append(kernel)
+                safeCosts.append(cost)
+            else:
+                if safeKernels != []:
+                    parts.append(self.make_batches(safeKernels, safeCosts))
+                    safeKernels = []
+                    safeCosts = []
+                parts.append([[kernel]])
+        if safeKernels != []:
+            parts.append(self.make_batches(safeKernels, safeCosts))
+
+        # Successive parts executed by the main thread are merged, in order
+        mergedParts = []
+        for part in parts:
+            if len(part) == 1 and mergedParts != [] and len(mergedParts[-1]) == 1:
+                mergedParts[-1][0].extend(part[0])
+            else:
+                mergedParts.append(part)
+        return tuple([tuple([tuple(batch) for batch in part]) \
+                      for part in mergedParts])
+
+    def make_batches(self, kernels, costs):
+        '''Group the kernels into batches of similar cost'''
+        nbBatches = int(min(self.nbThreads, len(kernels),
+                            max(1, sum(costs) // self.minBatchCost)))
+        if nbBatches == 1:
+            return [list(kernels)]
+        batches = [[] for i in range(nbBatches)]
+        loads = [0] * nbBatches
+        # The most expensive kernels first, each one in the least loaded batch
+        order = sorted(range(len(kernels)), key=lambda i: -costs[i])
+        for i in order:
+            lightest = loads.index(min(loads))
+            batches[lightest].append(kernels[i])
+            loads[lightest] += costs[i]
+        return batches
+
+def estimate_cost(owner, category):
+    '''Return an estimate of the cost of the kernel of the object owner'''
+    if category == 'connection':
+        return owner._execution_cost()
+    elif category == 'input':
+        return np.size(owner.output) * (len(owner.incoming_Cs) + 1)
+    cost = 0
+    for group in getattr(owner, 'groups', []):
+        cost += np.size(group.output)
+    return max(cost, 1)
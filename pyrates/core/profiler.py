@@ -0,0 +1,114 @@
+'''
+Module containing the Profiler class, the timing of the kernels executed at
+each time step of a simulation (see Simulation.run, argument profile).
+'''
+# Standard imports
+from __future__ import division
+from timeit import default_timer
+import sys
+
+__all__ = ["Profiler"]
+
+class Profiler(object):
+    '''Accumulate the wall time and the number of calls of the kernels of a
+    simulation.
+
+    The kernels are replaced by timed versions with method wrap, whose
+    signature is the one of the wrapper argument of ExecutionPlan.build_step.
+    The time of each kernel is accumulated by object and by category:
+    - 'connection': execution of a connection
+    - 'input': sum of the inputs of a group
+    - 'node': execution of a node
+    - 'integration': integration of the groups by a network integrator
+    - 'monitoring': recording of the monitors of an object
+    '''
+
+    categories = ['connection', 'input', 'node', 'integration', 'monitoring']
+
+    def __init__(self):
+
+        self.records = []
+        self.loopTime = 0.
+
+    def wrap(self, kernel, owner, category):
+        '''Return a version of the kernel that accumulates its wall time and
+        number of calls in the record of the owner.'''
+        name = getattr(owner, 'name', None)
+        if name is None:
+            name = str(owner)
+        # Mutable record updated by the timed kernel: time, number of calls
+        counters = [0., 0]
+        self.records.append((name, type(owner).__name__, category, counters))
+        timer = default_timer
+
+        def timed_kernel(*args):
+            start = timer()
+            result = kernel(*args)
+            counters[0] += timer() - start
+            counters[1] += 1
+            return result
+
+        return timed_kernel
+
+    def get_results(self):
+        '''Return the accumulated times as a dictionary with keys:
+        - 'objects': {category: {object name: {'class', 'time', 'calls'}}}
+        - 'classes': {class name: {'time', 'calls'}}
+        - 'loop time': the wall time of the whole execution loop
+        Times are in seconds.
+        '''
+        objects = dict([(category, {}) for category in self.categories])
+        classes = {}
+        for name, className, category, (time, calls) in self.records:
+            entry = objects[category].setdefault(name, {'class': className,
+                                                        'time': 0.,
+                                                        'calls': 0})
+            entry['time'] += time
+            entry['calls'] += calls
+            classEntry = classes.setdefault(className, {'time': 0.,
+                                                        'calls': 0})
+            classEntry['time'] += time
+            classEntry['calls'] += calls
+        return {'objects': objects,
+                'classes': classes,
+                'loop time': self.loopTime}
+
+    def report(self, results=None, stream=None):
+        '''Write the accumulated times, from the most expensive object to the
+        cheapest one.
+
+        Arguments:
+        - results: the dictionary of method get_results, by default the
+            current results
+        - stream: the file-like object written to, by default sys.stdout
+        '''
+        if results is None:
+            results = self.get_results()
+        if stream is None:
+            stream = sys.stdout
+        loopTime = results['loop time']
+        rows = []
+        for category, entries in results['objects'].items():
+            for name, entry in entries.items():
+                rows.append((entry['time'], name, entry['class'], category,
+                             entry['calls']))
+        rows.sort(reverse=True)
+
+        stream.write('Profile of the execution loop (%.3f s):\n'%loopTime)
+        line = '%-24s %-24s %-12s %10s %12s %12s %7s\n'
+        stream.write(line%('object', 'class', 'category', 'calls',
+                           'total (ms)', 'per call (us)', '%'))
+        for time, name, className, category, calls in rows:
+            if calls:
+                perCall = '%.2f'%(1e6 * time / calls)
+            else:
+                perCall = '-'
+            if loopTime > 0:
+                share = '%.1f'%(100 * time / loopTime)
+            else:
+                share = '-'
+            stream.write(line%(name[:24], className[:24], category, calls,
+                               '%.3f'%(1e3 * time), perCall, share))
+        profiledTime = sum([row[0] for row in rows])
+        stream.write('Time outside the profiled kernels: %.3f s\n'
+                     %(loopTime - profiledTime))
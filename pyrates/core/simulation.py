@@ -6,9 +6,17 @@ from __future__ import division
 #from warnings import warn
 import numpy as np
 import multiprocessing, traceback, sys
+from timeit import default_timer
 
 # Local imports
 from units import *
+from engine import ExecutionPlan
+from parallel import ThreadedPlan
+from slab import StateSlab
+from integrators import HeunIntegrator, RK4Integrator, AdaptiveIntegrator
+from profiler import Profiler
+from telemetry import Telemetry
+from steadystate import SteadyStateDetector
 import pyrates
 from pyrates.utils import gzip_save, regular_pickle
 import atexit
@@ -25,17 +33,74 @@ class Simulation(object):
         - deltat : it is the precision of the simulator and refers to the time
             elapsed between two time steps. It must be defines when time units
             are used to parameter the simulation.
+        - batchSize : number of independent instances of the network simulated
+            at once. When defined, the variables of the groups have a leading
+            batch dimension and parameters can be given per instance. It must be
+            set before the creation of the simulation objects.
+        - dtype : floating-point type of the variables of the groups, of the
+            weights, of the delay buffers and of the monitors, by default
+            float64. With float32 the memory used, and the memory bandwidth of
+            the matrix products, are halved at the cost of precision. It must
+            be set before the creation of the simulation objects.
+    
+    By default the simulation objects are registered in the simulation of
+    pyrates.scripting.global_methods. A simulation can also be used as a
+    context: the objects created inside the 'with' statement, in the same
+    thread, are registered in it. Several simulations can then be built and
+    run in one process, e.g. one per thread:
+        with Simulation(deltat=1.) as sim:
+            group = LeakyIntegrator(...)
+            ...
+        sim.run()
     '''
     
     simObjClsLink = None
     
+    # Engines available to execute the time steps of the simulation
+    engines = ['loop', 'compiled', 'threaded']
+    
+    # Network integrators available besides the default 'euler' integration
+    integrators = {HeunIntegrator.name: HeunIntegrator,
+                   RK4Integrator.name: RK4Integrator,
+                   AdaptiveIntegrator.name: AdaptiveIntegrator}
+    
     def __init__(self,
                  simTime=None,
-                 deltat=None):
+                 deltat=None,
+                 batchSize=None,
+                 dtype=None):
         
         self.simTime = simTime
         self.deltat = deltat
+        self.batchSize = batchSize
+        self.dtype = np.dtype(np.float64)
+        if dtype is not None:
+            self.set_dtype(dtype)
+        self.engine = 'loop'
+        self.nbThreads = None
+        self.__plan = None
+        self.useStateSlab = False
+        self.stateSlab = None
+        self.precomputeInputs = False
+        self.fuseConnections = False
+        self.integrator = 'euler'
+        self.__networkIntegrator = None
+        self.adaptiveTolerance = 1e-4
+        self.maxStepLength = 100
+        self.resampleMonitors = False
+        self.profile = False
+        self.profileData = None
+        self.__monitoringKernels = []
+        self.telemetryHooks = []
+        self.__checkpoint = None
+        self.__startTimeStep = 1
+        self.steadyStateTolerance = None
+        self.steadyStateTimeSteps = 100
+        self.steadyStateAction = 'stop'
+        self.steadyStateReached = False
+        self.__monitorTimeSteps = None
         self.__monitoringBounds = None
+        self.__currentBounds = None
         self.__isMonitoring = False
         self.__monitorManager = None
         self.__startMonitorSignal = False
@@ -51,11 +116,239 @@ class Simulation(object):
         self.inputs = []
         self.savedData = {}
         self.unnamedDataCount = 0
+        # Data is kept in savedData when no save folder is set
+        self.saveFolder = None
+        self.simulationName = None
+        self.compression = True
+        # When False the data is written by the simulation process itself, as
+        # required in daemonic processes (e.g. the workers of a process pool)
+        self.useWritingProcess = True
+        self.writingDataQueue = None
+        
+    def __enter__(self):
         
+        self.simObjClsLink._enter_simulation(self)
+        return self
+    
+    def __exit__(self, excType, excValue, traceback):
+        
+        self.simObjClsLink._exit_simulation(self)
+        return False
+    
     def set_deltat(self, value):
         self.deltat = value
         time2tstep.deltat = value
         
+    def set_threads(self, nbThreads=None):
+        '''Set the number of threads of the 'threaded' engine (see method
+        run), by default the number of cores.
+        '''
+        if nbThreads is not None and (type(nbThreads) is not int or nbThreads < 1):
+            raise ValueError, 'nbThreads must be a positive integer or None'
+        self.nbThreads = nbThreads
+    
+    def set_batch_size(self, batchSize):
+        '''Set the number of independent instances of the network simulated at
+        once. Must be called before the creation of the simulation objects.
+        '''
+        if self.allObjects != []:
+            msg = 'The batch size must be set before creating the objects of '\
+                + 'the simulation'
+            raise ValueError, msg
+        if batchSize is not None and (type(batchSize) is not int or batchSize < 1):
+            raise ValueError, 'batchSize must be a positive integer or None'
+        self.batchSize = batchSize
+    
+    def set_dtype(self, dtype):
+        '''Set the floating-point type of the simulation variables, e.g.
+        numpy.float32. Must be called before the creation of the simulation
+        objects: the weight matrices given to the connections are then cast
+        once, at their creation.
+        '''
+        if self.allObjects != []:
+            msg = 'The dtype must be set before creating the objects of the '\
+                + 'simulation'
+            raise ValueError, msg
+        dtype = np.dtype(dtype)
+        if dtype.kind != 'f':
+            raise ValueError, 'dtype must be a floating-point type'
+        self.dtype = dtype
+        
+    def set_adaptive_stepping(self,
+                              tolerance=1e-4,
+                              maxStepLength=100,
+                              resampleMonitors=False):
+        '''Set the parameters of the 'adaptive' integrator (see method run).
+        
+        Arguments:
+        - tolerance: the maximum local error on the states of the
+            LeakyIntegrator groups accepted for one step
+        - maxStepLength: the maximum number of time steps covered by one step
+        - resampleMonitors: the monitors record once per step and the time
+            step of each record is saved with the monitored data (key
+            'monitor time steps'). If True, the monitored data is linearly
+            interpolated onto every time step instead.
+        '''
+        if tolerance <= 0:
+            raise ValueError, 'tolerance must be positive'
+        if type(maxStepLength) is not int or maxStepLength < 1:
+            raise ValueError, 'maxStepLength must be a positive integer'
+        self.adaptiveTolerance = tolerance
+        self.maxStepLength = maxStepLength
+        self.resampleMonitors = resampleMonitors
+    
+    def set_steady_state_detection(self,
+                                   tolerance=1e-6,
+                                   nbTimeSteps=100,
+                                   action='stop'):
+        '''Detect during the runs when the states of all the groups are steady
+        (see pyrates.core.SteadyStateDetector), which requires the state slab.
+        
+        Arguments:
+        - tolerance: the maximum absolute change of the states in one time
+            step, None to disable the detection
+        - nbTimeSteps: the number of successive time steps for which the
+            changes must stay below the tolerance
+        - action: what is done once the states are steady:
+            - 'stop': the simulation stops, the monitors are closed and saved
+            - 'skip': the time steps are skipped until the next change of the
+                output of a node that is not integrable (e.g. the next change
+                of a StaticInput, see Node.get_next_change), the next
+                monitoring bound or the end of the simulation. The monitors
+                record the steady values for the skipped time steps. If no
+                output can change anymore the simulation stops.
+        
+        Attribute steadyStateReached tells if the last run was stopped.
+        '''
+        if action not in ['stop', 'skip']:
+            raise ValueError, "action must be 'stop' or 'skip'"
+        if tolerance is not None and tolerance < 0:
+            raise ValueError, 'tolerance must be positive'
+        if type(nbTimeSteps) is not int or nbTimeSteps < 1:
+            raise ValueError, 'nbTimeSteps must be a positive integer'
+        self.steadyStateTolerance = tolerance
+        self.steadyStateTimeSteps = nbTimeSteps
+        self.steadyStateAction = action
+    
+    def add_telemetry(self, hook, interval=1000):
+        '''Add a hook called with the progress of the runs.
+        
+        Arguments:
+        - hook: a callable taking one argument, the record of the progress (see
+            pyrates.core.Telemetry for its content), e.g. a JsonLinesTelemetry
+        - interval: the number of time steps between two calls of the hook. The
+            hook is also called at the end of each run.
+        '''
+        if not callable(hook):
+            raise TypeError, 'The telemetry hook must be callable'
+        if type(interval) is not int or interval < 1:
+            raise ValueError, 'interval must be a positive integer'
+        self.telemetryHooks.append((hook, interval))
+    
+    def remove_telemetry(self, hook):
+        '''Remove a hook added with method add_telemetry'''
+        self.telemetryHooks = [(otherHook, interval) for otherHook, interval \
+                               in self.telemetryHooks if otherHook is not hook]
+    
+    def checkpoint(self, fileName, compress=False):
+        '''Save the state of the simulation in a numpy .npz file: the state of
+        each object (see SimulationObject._checkpoint_state, e.g. the output,
+        state and input of the groups, the weights, output and delay queue of
+        the connections, the traces of the DAModulatedConnection and the task
+        state of the RealTaskNode), the state of the numpy random generator and
+        the next time step to execute.
+        
+        It can be called between runs or during a run, e.g. from a telemetry
+        hook (see method add_telemetry). The monitored data is not saved.
+        
+        Arguments:
+        - fileName: the path of the file
+        - compress: if True, the arrays are compressed
+        '''
+        arrays = {}
+        names = []
+        for index, obj in enumerate(self.allObjects):
+            names.append(str(obj))
+            for var, value in obj._checkpoint_state().items():
+                arrays['%d.%s'%(index, var)] = value
+        arrays['object names'] = np.array(names)
+        
+        if not hasattr(self, 'timeStep'):
+            nextTimeStep = 1
+        elif self.simulationOngoing:
+            # Called during a run, after the execution of time step timeStep
+            nextTimeStep = self.timeStep + 1
+        else:
+            nextTimeStep = self.timeStep
+        arrays['next time step'] = np.array(nextTimeStep)
+        
+        generator, keys, position, hasGauss, cachedGaussian = \
+            np.random.get_state()
+        arrays['random keys'] = keys
+        arrays['random position'] = np.array([position, hasGauss])
+        arrays['random cached gaussian'] = np.array(cachedGaussian)
+        
+        if compress:
+            np.savez_compressed(fileName, **arrays)
+        else:
+            np.savez(fileName, **arrays)
+    
+    @staticmethod
+    def read_checkpoint(fileName):
+        '''Return the content of a checkpoint file as a dictionary, which can
+        be given to method restore instead of the file name, e.g. to restore
+        the same checkpoint many times.
+        '''
+        data = np.load(fileName)
+        try:
+            checkpoint = dict([(key, data[key]) for key in data.files])
+        finally:
+            data.close()
+        return checkpoint
+    
+    def restore(self, checkpoint):
+        '''Restore the state saved by method checkpoint at the beginning of
+        the next run, once the objects are initialized. The run then starts at
+        the time step following the checkpoint.
+        
+        The simulation must be made of the same objects, created in the same
+        order, as the simulation that was saved.
+        
+        Arguments:
+        - checkpoint: the path of the checkpoint file, or its content returned
+            by method read_checkpoint
+        '''
+        if not isinstance(checkpoint, dict):
+            checkpoint = self.read_checkpoint(checkpoint)
+        
+        names = [str(name) for name in checkpoint['object names']]
+        if names != [str(obj) for obj in self.allObjects]:
+            msg = 'The objects of the simulation are not the ones of the '\
+                + 'checkpoint'
+            raise ValueError, msg
+        
+        # State of each object, by position in allObjects
+        states = [{} for obj in self.allObjects]
+        for key, value in checkpoint.items():
+            index, dot, var = key.partition('.')
+            if dot and index.isdigit():
+                states[int(index)][var] = value
+        self.__checkpoint = (states, checkpoint)
+    
+    def __apply_checkpoint(self):
+        
+        states, checkpoint = self.__checkpoint
+        self.__checkpoint = None
+        for obj, state in zip(self.allObjects, states):
+            if state:
+                obj._restore_state(state)
+        
+        position, hasGauss = checkpoint['random position']
+        np.random.set_state(('MT19937', checkpoint['random keys'],
+                             int(position), int(hasGauss),
+                             float(checkpoint['random cached gaussian'])))
+        self.__startTimeStep = int(checkpoint['next time step'])
+    
     def monitor_bounds(self, bounds=None, keepRunning=False):
         '''Set time step bounds to monitor_bounds object within these time step
         intervals
@@ -104,11 +397,77 @@ class Simulation(object):
     def run(self,
             simTime=None,
             deltat=None,
-            monitoringBounds=None):
+            monitoringBounds=None,
+            engine=None,
+            stateSlab=None,
+            precomputeInputs=None,
+            fuseConnections=None,
+            integrator=None,
+            profile=None):
         '''Main functions that runs the simulation.
         Note that simTime and deltat can be set in this function rather than in
         the __init__ function.
+        
+        Arguments:
+        - engine: the way the time steps are executed, either 'loop' (the
+            default) that goes through the lists of objects of the simulation,
+            'compiled' that executes the plan built by method compile, or
+            'threaded' that executes the independent objects of the plan on a
+            pool of threads (see method set_threads and
+            pyrates.core.ThreadedPlan). The engine is kept for the next runs.
+        - stateSlab: if True, the output, state and input of all the groups are
+            views into the contiguous buffers of a StateSlab (attribute
+            stateSlab), updated in place. The option is kept for the next runs.
+        - precomputeInputs: if True, the output of the connections sending from
+            a StaticInput is computed for the whole run at initialization, see
+            method precompute_input_projections. The option is kept for the
+            next runs.
+        - fuseConnections: if True, the plans of the 'compiled' and 'threaded'
+            engines compute the input of each group from the static and
+            undelayed connections it receives with a single matrix product,
+            and the output of the other static connections sharing their
+            sending group and their delay with a single matrix product, see
+            pyrates.core.ExecutionPlan. The results are the same up to
+            rounding errors. The option is kept for the next runs.
+        - integrator: the integration of the LeakyIntegrator groups, 'euler'
+            (the default) integrates each group with its own method, 'heun' or
+            'rk4' integrate the whole network at once with a higher order
+            method (see pyrates.core.NetworkIntegrator). A network integrator
+            uses the state slab and replaces the engine. The 'adaptive'
+            integrator uses Heun's method with steps covering a variable number
+            of time steps, see method set_adaptive_stepping and
+            pyrates.core.AdaptiveIntegrator. The integrator is kept for the
+            next runs.
+        - the detection of the steady state is set with method
+            set_steady_state_detection.
+        - profile: if True, the wall time and the number of calls of the
+            execution of each connection, group input, node and monitor are
+            accumulated (see pyrates.core.Profiler). The results are printed at
+            the end of the run, kept in attribute profileData and returned.
+            profile can also be a file-like object, the results are then
+            written to it instead of being printed. The time steps are then
+            executed by the plan of method compile, which gives the same
+            results as the 'loop' engine. The option is kept for the next runs.
         '''
+        if engine is not None:
+            if engine not in self.engines:
+                msg = 'engine argument must be one of %s'%str(self.engines)
+                raise ValueError, msg
+            self.engine = engine
+        if stateSlab is not None:
+            self.useStateSlab = stateSlab
+        if precomputeInputs is not None:
+            self.precomputeInputs = precomputeInputs
+        if fuseConnections is not None:
+            self.fuseConnections = fuseConnections
+        if integrator is not None:
+            if integrator != 'euler' and integrator not in self.integrators:
+                msg = 'integrator argument must be euler or one of %s'
+                raise ValueError, msg%str(self.integrators.keys())
+            self.integrator = integrator
+        if profile is not None:
+            self.profile = profile
+        
         if self.__monitorManager is None:
             if self.monitoredObjects != []:
                 self.monitor_bounds()
@@ -125,16 +484,30 @@ class Simulation(object):
         self.initialize_nodes()
         # connections initialization must happen after initialization of nodes!
         self.initialize_connections()
+        if self.__checkpoint is not None:
+            self.__apply_checkpoint()
         
-        if self.__monitorManager is not None:
+        if self.precomputeInputs:
+            self.precompute_input_projections()
+        if self.useStateSlab or self.integrator != 'euler' or \
+                self.steadyStateTolerance is not None:
+            self.build_state_slab()
+        if self.integrator != 'euler':
+            self.build_network_integrator()
+        elif self.engine != 'loop' or self.profile:
+            self.compile()
+        
+        if self.__monitorManager is not None and self.useWritingProcess:
             self.writingDataQueue = multiprocessing.Queue()
             self.writing_process = WriteProcess(self.writingDataQueue)
             self.writing_process.start()
+        else:
+            self.writingDataQueue = None
         
         try:
             self.__core_loop()
         except Exception:
-            if self.__monitorManager is not None:
+            if self.writingDataQueue is not None:
                 self.writingDataQueue.put(None)
             exc_type, exc_value, exc_traceback = sys.exc_info()
             print 'Traceback of exception: %s of %s'%(exc_value, str(exc_type))
@@ -142,15 +515,19 @@ class Simulation(object):
             print '\n'
             raise exc_type, exc_value
             
-        if self.__monitorManager is not None:
+        if self.writingDataQueue is not None:
             self.writingDataQueue.put(None)
             
         print 'simulation done!'
+        
+        if self.profile:
+            return self.profileData
     
     def __core_loop(self):
         
         if self.__monitorManager is self:
             currentBounds = self.__monitoringBounds.pop(0)
+            self.__currentBounds = currentBounds
             if currentBounds[0] == 0:
                 if currentBounds[1] != None:
                     nbTimeSteps = currentBounds[1] + 1
@@ -167,22 +544,49 @@ class Simulation(object):
         print 'Number of time-steps : %s'%nbTimeSteps
         print 'Running!!!'
         
-        self.timeStep = 1
+        adaptive = False
+        plan = None
+        if self.integrator != 'euler':
+            plan = self.__networkIntegrator
+            adaptive = plan.adaptive
+        elif self.engine != 'loop' or self.profile:
+            plan = self.__plan
+        
+        self.__monitoringKernels = [obj._monitoring \
+                                    for obj in self.monitoredObjects]
+        if self.profile:
+            profiler = Profiler()
+            step = plan.build_step(profiler.wrap)
+            self.__monitoringKernels = [
+                profiler.wrap(kernel, obj, 'monitoring') for kernel, obj \
+                in zip(self.__monitoringKernels, self.monitoredObjects)]
+        elif plan is not None:
+            step = plan.step
+        else:
+            step = self.__loop_step
+        
+        telemetry = None
+        if self.telemetryHooks != []:
+            telemetry = Telemetry(self, self.telemetryHooks)
+        
+        steadyState = None
+        self.steadyStateReached = False
+        if self.steadyStateTolerance is not None:
+            steadyState = SteadyStateDetector(self.stateSlab,
+                                              self.steadyStateTolerance,
+                                              self.steadyStateTimeSteps)
+        
+        loopStart = default_timer()
+        self.timeStep = self.__startTimeStep
+        self.__startTimeStep = 1
         ########## THE execution loop! #########################################
         while self.simulationOngoing:
             
-            # Update the connections
-            for connection in self.connections:
-                connection._execute(self.timeStep)
-            
-            # Compute the input vector of each group with the output of the
-            # previous time step
-            for group in self.groups:
-                group._add_up_inputs()
-            
-            # Execute all the nodes and the groups inside the nodes
-            for node in self.nodes:
-                node._execute(self.timeStep)
+            # Update the connections, the inputs of the groups and the nodes
+            step(self.timeStep)
+            if adaptive:
+                # The time step is now the last one covered by the step
+                self.timeStep += self.__networkIntegrator.stepLength - 1
             
             # Do the actual monitoring work!
             if self.__isMonitoring:
@@ -200,11 +604,14 @@ class Simulation(object):
                         self.__stop_monitoring()
                         if self.__monitoringBounds != []:
                             currentBounds = self.__monitoringBounds.pop(0)
+                            self.__currentBounds = currentBounds
                         # To be removed to keep the simulation going without
                         # monitoring
-                        elif not self.keepRunning:
-                            self.simulationOngoing = False
-                            print 'No more monitors, simulation stops'
+                        else:
+                            self.__currentBounds = None
+                            if not self.keepRunning:
+                                self.simulationOngoing = False
+                                print 'No more monitors, simulation stops'
                 else:
                     if self.timeStep == currentBounds[0]:
                         if currentBounds[1] != None:
@@ -213,13 +620,39 @@ class Simulation(object):
                             nbTimeSteps = None
                         self.start_monitoring(nbTimeSteps)
                         
+            if telemetry is not None and self.timeStep >= telemetry.nextTimeStep:
+                telemetry.update(self.timeStep)
+            
+            if steadyState is not None:
+                if adaptive:
+                    steady = steadyState.update(self.__networkIntegrator.stepLength)
+                else:
+                    steady = steadyState.update()
+                if steady:
+                    if self.steadyStateAction == 'skip':
+                        self.__skip_steady_state(adaptive)
+                        steadyState.reset()
+                    else:
+                        self.__stop_steady_state()
+            
             self.timeStep += 1
             
             if self.nbTimeStepsSim is not None and self.timeStep >= self.nbTimeStepsSim + 1:
                 self.simulationOngoing = False
         ###################################################################
+        if telemetry is not None:
+            telemetry.update(self.timeStep - 1, done=True)
+        if self.profile:
+            profiler.loopTime = default_timer() - loopStart
+            self.profileData = profiler.get_results()
+            stream = None
+            if hasattr(self.profile, 'write'):
+                stream = self.profile
+            profiler.report(self.profileData, stream)
         if self.__isMonitoring:
-            if self.__monitorManager is self:
+            if self.steadyStateReached:
+                pass
+            elif self.__monitorManager is self:
                 if currentBounds[1] is not None:
                     msg = 'Simulation stopped before the end of the last '\
                         + 'monitor bound!'
@@ -231,6 +664,132 @@ class Simulation(object):
             self.__stop_monitoring()
             self.save_data()
     
+    def __stop_steady_state(self):
+        
+        self.simulationOngoing = False
+        self.steadyStateReached = True
+        print 'Steady state reached at time step %d, simulation stops'%self.timeStep
+    
+    def __skip_steady_state(self, adaptive):
+        '''Skip the time steps following the current one until the next change
+        of the output of a node that is not integrable, the next monitoring
+        bound or the end of the simulation.
+        '''
+        if self.__startMonitorSignal or self.__stopMonitorSignal:
+            return
+        nextTimeStep = self.timeStep + 1
+        resumeTimeSteps = []
+        for node in self.nodes:
+            if not node.integrable:
+                change = node.get_next_change(nextTimeStep)
+                if change is not None:
+                    resumeTimeSteps.append(change)
+        horizon = self.get_step_horizon(nextTimeStep)
+        if horizon is not None:
+            resumeTimeSteps.append(nextTimeStep + horizon - 1)
+        if resumeTimeSteps == []:
+            # Nothing can change anymore
+            self.__stop_steady_state()
+            return
+        
+        resumeTimeStep = int(np.min(resumeTimeSteps))
+        nbSkipped = resumeTimeStep - nextTimeStep
+        if nbSkipped <= 0:
+            return
+        if self.__isMonitoring:
+            if adaptive:
+                # The time step of each record is kept, one is enough
+                self.timeStep = resumeTimeStep - 1
+                self.__monitoring()
+            else:
+                for obj in self.monitoredObjects:
+                    obj._repeat_monitoring(nbSkipped)
+        self.timeStep = resumeTimeStep - 1
+    
+    def __loop_step(self, timeStep):
+        '''Execute one time step by going through the objects of the simulation
+        '''
+        # Update the connections
+        for connection in self.connections:
+            connection._execute(timeStep)
+        
+        # Compute the input vector of each group with the output of the
+        # previous time step
+        for group in self.groups:
+            group._add_up_inputs()
+        
+        # Execute all the nodes and the groups inside the nodes
+        for node in self.nodes:
+            node._execute(timeStep)
+    
+    def compile(self):
+        '''Build the execution plan of the simulation, a flat and pre-ordered
+        list of the kernels executed at each time step.
+        
+        With the 'threaded' engine, the plan is a ThreadedPlan.
+        
+        Must be called after the initialization of the nodes and connections.
+        The plan is reused as long as the objects of the simulation do not
+        change, only the arrays of the objects are re-bound.
+        '''
+        if self.engine == 'threaded':
+            planClass = ThreadedPlan
+        else:
+            planClass = ExecutionPlan
+        if type(self.__plan) is not planClass or \
+                not self.__plan.matches(self) or \
+                (planClass is ThreadedPlan and \
+                 self.__plan.nbThreads != (self.nbThreads or \
+                                           multiprocessing.cpu_count())):
+            if isinstance(self.__plan, ThreadedPlan):
+                self.__plan.close()
+            if planClass is ThreadedPlan:
+                self.__plan = ThreadedPlan(self, self.nbThreads)
+            else:
+                self.__plan = ExecutionPlan(self)
+        self.__plan.bind()
+        return self.__plan
+    
+    def precompute_input_projections(self):
+        '''Compute at once the output of the connections whose sending group
+        is the output of a StaticInput, for all the time steps of the input
+        (by chunks of Connection.projectionChunkSize time steps). The
+        connections then only read their output at each time step.
+        
+        Must be called after the initialization of the nodes and connections.
+        '''
+        for connection in self.connections:
+            if connection._has_static_sender():
+                connection._precompute_projection()
+    
+    def build_network_integrator(self):
+        '''Build the network integrator selected with the integrator argument of
+        method run.
+        
+        Must be called after the creation of the state slab. The integrator is
+        reused as long as the objects of the simulation do not change.
+        '''
+        integratorClass = self.integrators[self.integrator]
+        if type(self.__networkIntegrator) is not integratorClass or \
+                not self.__networkIntegrator.matches(self):
+            self.__networkIntegrator = integratorClass(self)
+        self.__networkIntegrator.bind()
+        return self.__networkIntegrator
+    
+    def build_state_slab(self):
+        '''Allocate the contiguous buffers of the groups variables and bind the
+        groups to their views into it.
+        
+        Must be called after the initialization of the nodes and connections.
+        The buffers are reused as long as the groups of the simulation do not
+        change.
+        '''
+        if self.stateSlab is None or not self.stateSlab.matches(self.groups):
+            self.stateSlab = StateSlab(self.groups, self.batchSize,
+                                       self.dtype)
+        self.stateSlab.bind()
+        return self.stateSlab
+    
     def get_monitoring_bounds(self):
         return self.__monitoringBounds
     
@@ -249,8 +808,10 @@ class Simulation(object):
     
     def __monitoring(self):
         '''Save the successive states of different objects of the simulation'''
-        for obj in self.monitoredObjects:
-            obj._monitoring(self.timeStep)
+        for kernel in self.__monitoringKernels:
+            kernel(self.timeStep)
+        if self.__monitorTimeSteps is not None:
+            self.__monitorTimeSteps.append(self.timeStep)
     
     def start_monitoring(self, nbTimeSteps=None, blockName=None):
         self.__newBlockName = blockName
@@ -265,6 +826,11 @@ class Simulation(object):
         self.__currentBlockName = self.__newBlockName
         del self.__newBlockName
         self.initialize_monitors(self.__monitorNbTimeSteps)
+        # With steps of variable length the time step of each record is kept
+        if self.integrator != 'euler' and self.__networkIntegrator.adaptive:
+            self.__monitorTimeSteps = [self.timeStep]
+        else:
+            self.__monitorTimeSteps = None
     
     def stop_monitoring(self):
         if not self.__isMonitoring:
@@ -280,9 +846,39 @@ class Simulation(object):
         self.__stopMonitorSignal = False
         self.__isMonitoring = False
         self.close_monitors()
+        if self.__monitorTimeSteps is not None and self.resampleMonitors:
+            self.resample_monitors()
         self.save_data(dataName=self.__currentBlockName)
         del self.__currentBlockName
     
+    def resample_monitors(self):
+        '''Linearly interpolate the data recorded by the monitors at the time
+        steps of an adaptive integrator onto every time step.
+        Must be called after closing the monitors.
+        '''
+        timeSteps = np.array(self.__monitorTimeSteps)
+        newTimeSteps = np.arange(timeSteps[0], timeSteps[-1] + 1)
+        for obj in self.monitoredObjects:
+            obj._resample_monitors(timeSteps, newTimeSteps)
+        self.__monitorTimeSteps = list(newTimeSteps)
+    
+    def get_step_horizon(self, timeStep):
+        '''Return the maximum number of time steps that can be covered by a
+        step of an adaptive integrator starting at timeStep, so that the step
+        ends on the monitoring bounds and on the end of the simulation, or None
+        if there is no limit.
+        '''
+        lastTimeSteps = []
+        if self.nbTimeStepsSim is not None:
+            lastTimeSteps.append(self.nbTimeStepsSim)
+        if self.__monitorManager is self and self.__currentBounds is not None:
+            for bound in self.__currentBounds:
+                if bound is not None and bound >= timeStep:
+                    lastTimeSteps.append(bound)
+        if lastTimeSteps == []:
+            return None
+        return int(np.min(lastTimeSteps)) - timeStep + 1
+    
     def isMonitoring(self):
         return self.__isMonitoring
     
@@ -290,7 +886,8 @@ class Simulation(object):
                         folder=None,
                         simulationName=None,
                         compression=True):
-        
+        '''Set where the data of the simulation is saved. If no folder is set,
+        the data is kept in memory in the dictionary savedData.'''
         self.saveFolder = folder
         self.simulationName = simulationName
         self.compression = compression
@@ -323,13 +920,22 @@ class Simulation(object):
         
         savedData['data origin'] = 'PyRates %s'%pyrates.__version__
         savedData['monitor manager'] = str(self.__monitorManager)
+        if self.__monitorTimeSteps is not None:
+            savedData['monitor time steps'] = np.array(self.__monitorTimeSteps)
         
         if dataName is None:
             dataName = "unnamed_%d"%self.unnamedDataCount
             self.unnamedDataCount += 1
         
+        if self.saveFolder is None:
+            self.savedData[dataName] = savedData
+            return
+        
         d = DataWriter(savedData, self.saveFolder, dataName, self.simulationName, self.compression)
-        self.writingDataQueue.put(d)
+        if self.writingDataQueue is not None:
+            self.writingDataQueue.put(d)
+        else:
+            d.write()
         
     def post_run(self):
         '''Operations done after the execution of the main function "run"'''
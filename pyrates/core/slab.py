@@ -0,0 +1,65 @@
+'''
+Module containing the StateSlab class, the contiguous storage of the variables
+of all the groups of a simulation.
+'''
+
+# Standard imports
+import numpy as np
+
+__all__ = ["StateSlab"]
+
+class StateSlab(object):
+    '''One contiguous buffer per group variable (output, state and input) for
+    all the groups of the simulation.
+
+    Arguments:
+    - groups: the list of the groups sharing the slab
+    - batchSize: the number of instances of a batched simulation, the buffers
+        then have a leading batch dimension
+
+    Each group is given views into the buffers with method bind, and its
+    variables are then updated in place. The whole network state can be read
+    at once from the buffers, e.g. slab.output, while slab.slices gives the
+    part of the buffers owned by each group.
+    '''
+
+    variables = ['output', 'state', 'input']
+
+    def __init__(self, groups, batchSize=None, dtype=float):
+
+        self.groups = tuple(groups)
+        self.slices = {}
+        start = 0
+        for group in self.groups:
+            self.slices[group] = slice(start, start + group.nbUnits)
+            start += group.nbUnits
+        self.nbUnits = start
+        self.batchSize = batchSize
+
+        if batchSize is None:
+            shape = (self.nbUnits,)
+        else:
+            shape = (batchSize, self.nbUnits)
+        self.output = np.zeros(shape, dtype)
+        self.state = np.zeros(shape, dtype)
+        self.input = np.zeros(shape, dtype)
+
+    def matches(self, groups):
+        '''Return True if the slab can be reused for the groups'''
+        return tuple(groups) == self.groups
+
+    def bind(self):
+        '''Give each group its views into the buffers. The current values of the
+        variables of the groups are copied into the slab.
+        Must be called after the initialization of the groups, each time the
+        simulation is run.
+        '''
+        for group in self.groups:
+            groupSlice = self.slices[group]
+            group._bind_slab(self.output[..., groupSlice],
+                             self.state[..., groupSlice],
+                             self.input[..., groupSlice])
+
+    def get_group_slice(self, group):
+        '''Return the slice of the buffers owned by the group'''
+        return self.slices[group]
@@ -0,0 +1,51 @@
+'''
+Module containing the SteadyStateDetector class, the convergence criterion of
+the runs of a simulation (see Simulation.set_steady_state_detection).
+'''
+# Standard imports
+import numpy as np
+
+__all__ = ["SteadyStateDetector"]
+
+class SteadyStateDetector(object):
+    '''Detect when the states of all the groups stop changing.
+
+    Arguments:
+    - slab: the StateSlab of the simulation, holding the states of all the
+        groups
+    - tolerance: the maximum absolute change of a state in one time step
+    - nbTimeSteps: the number of successive time steps for which the changes
+        must stay below the tolerance
+
+    Method update must be called after each step of the simulation. It
+    compares the states to the ones of the previous step on the whole slab at
+    once.
+    '''
+
+    def __init__(self, slab, tolerance, nbTimeSteps):
+
+        self.slab = slab
+        self.tolerance = tolerance
+        self.nbTimeSteps = nbTimeSteps
+        self.previousState = slab.state.copy()
+        self.difference = np.empty_like(slab.state)
+        self.quietTimeSteps = 0
+
+    def update(self, stepLength=1):
+        '''Return True when the states have been steady for nbTimeSteps time
+        steps, stepLength being the number of time steps covered by the last
+        step.
+        '''
+        difference = self.difference
+        np.subtract(self.slab.state, self.previousState, out=difference)
+        np.abs(difference, out=difference)
+        if difference.size and difference.max() > self.tolerance * stepLength:
+            self.quietTimeSteps = 0
+        else:
+            self.quietTimeSteps += stepLength
+        self.previousState[...] = self.slab.state
+        return self.quietTimeSteps >= self.nbTimeSteps
+
+    def reset(self):
+        '''Start counting the steady time steps again'''
+        self.quietTimeSteps = 0
@@ -0,0 +1,123 @@
+'''
+Module containing the telemetry of the simulation: the progress records given
+periodically to the hooks added with Simulation.add_telemetry, and
+JsonLinesTelemetry, a hook writing them to a file.
+'''
+# Standard imports
+from __future__ import division
+from timeit import default_timer
+import json
+
+__all__ = ["Telemetry", "JsonLinesTelemetry"]
+
+class Telemetry(object):
+    '''Progress of a run, given every few time steps to the telemetry hooks.
+
+    Arguments:
+    - simulation: the Simulation instance that is run
+    - hooks: list of (hook, interval) tuples, each hook being called every
+        interval time steps with a record, a dictionary with keys:
+        - 'time step': the last time step executed
+        - 'elapsed time': the wall time since the start of the run, in seconds
+        - 'steps per second': the number of time steps executed per second
+            since the previous record of the hook
+        - 'eta': the estimated wall time left until the end of the simulation,
+            in seconds, or None when the number of time steps is unknown
+        - 'monitor bytes': the memory used by the monitors
+        - 'writer queue size': the number of data blocks waiting to be written
+            by the writing process, or None if there is no writing process
+        - 'done': True for the last record, made at the end of the run
+    '''
+
+    def __init__(self, simulation, hooks):
+
+        self.simulation = simulation
+        self.hooks = list(hooks)
+        self.startTime = default_timer()
+        # Time step and wall time of the previous record of each hook
+        self.previous = [(0, self.startTime) for hook in self.hooks]
+        self.nextTimeSteps = [interval for hook, interval in self.hooks]
+        self.nextTimeStep = min(self.nextTimeSteps)
+
+    def update(self, timeStep, done=False):
+        '''Call the hooks whose interval is over at timeStep, or all the hooks
+        if done is True.'''
+        now = default_timer()
+        record = None
+        for index, (hook, interval) in enumerate(self.hooks):
+            if not done and timeStep < self.nextTimeSteps[index]:
+                continue
+            if record is None:
+                record = self.get_record(timeStep, now, done)
+            previousTimeStep, previousTime = self.previous[index]
+            if now > previousTime:
+                stepsPerSecond = (timeStep - previousTimeStep) / (now - previousTime)
+            else:
+                stepsPerSecond = None
+            hookRecord = dict(record)
+            hookRecord['steps per second'] = stepsPerSecond
+            hook(hookRecord)
+            self.previous[index] = (timeStep, now)
+            self.nextTimeSteps[index] = timeStep + interval
+        self.nextTimeStep = min(self.nextTimeSteps)
+
+    def get_record(self, timeStep, now, done):
+        '''Return the values of the record shared by the hooks'''
+        simulation = self.simulation
+        elapsedTime = now - self.startTime
+
+        eta = None
+        nbTimeStepsSim = simulation.nbTimeStepsSim
+        if nbTimeStepsSim is not None and timeStep > 0:
+            eta = (nbTimeStepsSim - timeStep) * elapsedTime / timeStep
+
+        monitorBytes = 0
+        for obj in simulation.monitoredObjects:
+            monitorBytes += obj._monitor_nbytes()
+
+        queueSize = None
+        if simulation.writingDataQueue is not None:
+            try:
+                queueSize = simulation.writingDataQueue.qsize()
+            except NotImplementedError:
+                # Not available on every platform
+                pass
+
+        return {'time step': timeStep,
+                'elapsed time': elapsedTime,
+                'eta': eta,
+                'monitor bytes': monitorBytes,
+                'writer queue size': queueSize,
+                'done': done}
+
+class JsonLinesTelemetry(object):
+    '''Telemetry hook appending each record as one JSON line to a file.
+
+    Arguments:
+    - fileName: the path of the file, or a file-like object the records are
+        written to, e.g. sys.stdout
+    - extra: dictionary of values added to every record, e.g. the name of the
+        simulation
+
+    Example:
+        sim.add_telemetry(JsonLinesTelemetry('run.jsonl'), interval=10000)
+    '''
+
+    def __init__(self, fileName, extra=None):
+
+        self.fileName = fileName
+        self.extra = extra
+
+    def __call__(self, record):
+
+        if self.extra is not None:
+            record = dict(record)
+            record.update(self.extra)
+        line = json.dumps(record, sort_keys=True) + '\n'
+        if hasattr(self.fileName, 'write'):
+            self.fileName.write(line)
+            return
+        # The file is only opened for the write, so that it can be read or
+        # rotated while the simulation is running
+        with open(self.fileName, 'a') as telemetryFile:
+            telemetryFile.write(line)
@@ -30,6 +30,13 @@ class Unit(object):
         self.value = self.checkOutputValue(other / self.value)
         return self
     
+    # Division in the modules using from __future__ import division
+    def __truediv__(self, other):
+        return self.__div__(other)
+    
+    def __rtruediv__(self, other):
+        return self.__rdiv__(other)
+    
     def __add__(self, other):
         self.checkOtherType(other)
         self.value = self.checkOutputValue(self.value + other)
@@ -205,24 +212,27 @@ class Deltat(Unit):
     def __repr__(self):
         return str(self.value) + ' ms/ts'
 
-def time2tstep(time, whoAsk=None):
+def time2tstep(time, whoAsk=None, deltat=None):
     '''Convert time into time steps with deltat.
     WARNING:
     Make sure delta_t is set before using the function, otherwise the conversion
     will be done with the default delta_t value if set.
     Argument whoAsk allows to precise which object asked for the conversion if
-    the division is not round.
+    the division is not round. Argument deltat, a number or a Deltat, replaces
+    the global value, e.g. with the deltat of the simulation of the object.
     '''
-    if time2tstep.deltat == None:
+    if deltat is None:
+        deltat = time2tstep.deltat
+    if deltat == None:
         msg = 'You must specify value for deltat before trying to do a conversion.'
         msg += 'Use function set_deltat()'
         raise ValueError, msg
     if not issubclass(type(time), Time):
         raise TypeError, "Type of argument time must be a subclass of Time"
     
-    tmp = time / time2tstep.deltat.value
+    tmp = time.value / float(getattr(deltat, 'value', deltat))
     outputValue = int(round(tmp))
-    if outputValue - round(outputValue) != 0:
+    if tmp - outputValue != 0:
         if whoAsk is not None:
             warnMsg = "Conversion from Time to TimeStep in object %s"%(whoAsk)
             warnMsg += " had value %f. It was rounded to %d"%(tmp, outputValue)
@@ -232,12 +242,14 @@ def time2tstep(time, whoAsk=None):
     
     return TimeStep(outputValue, 1)
 
-def tstep2time(timeSteps):
+def tstep2time(timeSteps, deltat=None):
     '''Convert time steps into time with deltat.
     WARNING:
     Make sure delta_t is set before using the function, otherwise the conversion
     will be done with the default delta_t value if set.
     '''
+    if deltat is not None:
+        return timeSteps * getattr(deltat, 'value', deltat)
     if tstep2time.deltat == None:
         msg = 'You must specify value for deltat before trying to do a conversion.'
         msg += 'Use function set_deltat()'
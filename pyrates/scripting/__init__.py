@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 #TODO: document scripting package
 from global_methods import *
+from sweep import *
 
-del global_methods
\ No newline at end of file
+del global_methods
+del sweep
\ No newline at end of file
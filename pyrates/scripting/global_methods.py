@@ -21,7 +21,8 @@ from pyrates.core.units import Deltat, numericTypes
 from pyrates.simobjects.simulation_object import SimulationObject
 
 __all__ = ["reset_states", "reset_states_outputs","monitor_bounds", 
-           "save_data", "load_data", "run_sim", "ms", "s", "min"]
+           "save_data", "load_data", "run_sim", "set_batch_size", "set_dtype",
+           "ms", "s", "min"]
 
 ###################### Global variables ######################################
 # Time variables
@@ -42,6 +43,20 @@ def set_deltat(deltat):
     else:
         raise TypeError, 'deltat argument must be a number or a Deltat object'
     
+def set_batch_size(batchSize):
+    '''Set the number of independent instances of the network simulated at
+    once. Must be called before creating the objects of the simulation.
+    For more details, see Simulation.set_batch_size.__doc__
+    '''
+    sim.set_batch_size(batchSize)
+
+def set_dtype(dtype):
+    '''Set the floating-point type of the variables of the simulation, e.g.
+    numpy.float32. Must be called before creating the objects of the
+    simulation. For more details, see Simulation.set_dtype.__doc__
+    '''
+    sim.set_dtype(dtype)
+    
 def run_sim(*args, **kwargs):
     """Launch the simulation.
     Arguments:
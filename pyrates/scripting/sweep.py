@@ -0,0 +1,127 @@
+"""
+This module contains the methods to run a parameter sweep: the same network is
+simulated for several configurations of parameters in a pool of processes.
+"""
+# Standard imports
+import itertools
+import multiprocessing
+import traceback
+import numpy as np
+
+# Local imports
+import global_methods
+from pyrates.core.simulation import Simulation
+from pyrates.simobjects.simulation_object import SimulationObject
+
+__all__ = ["parameter_grid", "run_sweep"]
+
+def parameter_grid(**parameters):
+    '''Return the list of all the combinations of parameters values.
+    
+    Example: parameter_grid(tau=[10, 20], C1=[1e-5, 1e-4]) returns a list of 4
+    dictionaries, from {'tau': 10, 'C1': 1e-5} to {'tau': 20, 'C1': 1e-4}.
+    '''
+    names = sorted(parameters.keys())
+    grid = []
+    for values in itertools.product(*[parameters[name] for name in names]):
+        grid.append(dict(zip(names, values)))
+    return grid
+
+def run_sweep(buildNetwork,
+              parameterGrid,
+              runArgs=None,
+              nbProcesses=None,
+              seed=None,
+              summary=None,
+              cost=None,
+              saveFolder=None,
+              simulationName='sweep'):
+    '''Run a network for every configuration of a parameter grid, each in a
+    separate process with its own Simulation instance.
+    
+    Arguments:
+    - buildNetwork: function called with the parameters of a configuration as
+        keyword arguments. It creates the objects of the network, which are
+        registered in the Simulation of the worker, and may return an object
+        (e.g. a dictionary of the created objects) passed to summary. It must
+        be defined at the top level of a module to be sent to the workers.
+    - parameterGrid: a list of dictionaries of parameters, or a dictionary of
+        lists of values that is expanded with parameter_grid.
+    - runArgs: dictionary of keyword arguments passed to Simulation.run
+    - nbProcesses: number of worker processes, the number of CPUs by default
+    - seed: base seed of the sweep, configuration i is run with seed + i. If
+        None, a base seed is drawn at random.
+    - summary: function called with the simulation and the object returned by
+        buildNetwork after the run. Its output is the result of the run. By
+        default, the result is the data saved by the simulation, kept in
+        memory only when there is no saveFolder.
+    - cost: function called with the parameters of a configuration, returning
+        an estimate of its duration. The longest configurations are run first.
+    - saveFolder: if set, the data of configuration i is saved in this
+        folder with simulation name simulationName_i instead of being
+        returned: without a summary, the result is then an empty dictionary.
+    
+    Returns a list with, for each configuration in the order of the grid, a
+    dictionary with keys 'parameters', 'seed', 'result' and 'error'. A failed
+    configuration has its traceback in 'error' and does not stop the sweep.
+    '''
+    if isinstance(parameterGrid, dict):
+        parameterGrid = parameter_grid(**parameterGrid)
+    if runArgs is None:
+        runArgs = {}
+    if seed is None:
+        seed = np.random.randint(0, 2**31 - 1 - len(parameterGrid))
+    
+    tasks = []
+    for index, parameters in enumerate(parameterGrid):
+        tasks.append((index, parameters, seed + index, buildNetwork, runArgs,
+                      summary, saveFolder, simulationName))
+    if cost is not None:
+        tasks.sort(key=lambda task: cost(task[1]), reverse=True)
+    
+    # One process per configuration so that no state leaks between runs
+    pool = multiprocessing.Pool(processes=nbProcesses, maxtasksperchild=1)
+    results = [None] * len(tasks)
+    try:
+        for index, result in pool.imap_unordered(_run_configuration, tasks,
+                                                 chunksize=1):
+            results[index] = result
+            if result['error'] is not None:
+                print 'Sweep: configuration %d failed'%index
+            else:
+                print 'Sweep: configuration %d done'%index
+    finally:
+        pool.close()
+        pool.join()
+    
+    return results
+
+def _run_configuration(task):
+    '''Run one configuration of a sweep in a new Simulation instance'''
+    (index, parameters, seed, buildNetwork, runArgs, summary, saveFolder,
+     simulationName) = task
+    output = {'parameters': parameters,
+              'seed': seed,
+              'result': None,
+              'error': None}
+    try:
+        sim = Simulation()
+        # Workers of a pool cannot start the process writing data on disk
+        sim.useWritingProcess = False
+        if saveFolder is not None:
+            sim.set_save_folder(saveFolder, '%s_%d'%(simulationName, index))
+        SimulationObject.simulationRef = sim
+        global_methods.sim = sim
+        np.random.seed(seed)
+        
+        network = buildNetwork(**parameters)
+        sim.run(**runArgs)
+        
+        if summary is not None:
+            output['result'] = summary(sim, network)
+        else:
+            output['result'] = sim.savedData
+    except Exception:
+        output['error'] = traceback.format_exc()
+    
+    return index, output
@@ -13,8 +13,11 @@ from nodes import *
 
 # Make links between simulation object classes:
 Connection.nodeLink = Node
+Connection.staticInputLink = StaticInput
 Group.singleGrpNodeLink = SingleGrpNode
 from pyrates.core.simulation import Simulation
+from pyrates.core.integrators import NetworkIntegrator
 Simulation.simObjClsLink = SimulationObject
+NetworkIntegrator.leakyIntegratorLink = LeakyIntegrator
 
 del simulation_object
\ No newline at end of file
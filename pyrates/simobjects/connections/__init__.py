@@ -4,13 +4,20 @@
 Modules:
   - connection: contains the basic Connection class
   - dynamic_connections: contains the different dynamic connections
+  - convolution_connections: contains the convolution connection
+  - plastic_connections: contains the plasticity rules and the plastic
+    connection
 '''
 
 from connection import *
 from dynamic_connections import *
+from convolution_connections import *
+from plastic_connections import *
 
 del connection
 del dynamic_connections
+del convolution_connections
+del plastic_connections
 
 #__all__ = ["Connection", "StaticConnection", "DynamicConnection",
 #           "DAModulatedConnection", "DAconnectionCVDtask"]
\ No newline at end of file
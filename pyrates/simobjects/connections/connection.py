@@ -13,10 +13,16 @@ This module defines the classes:
 # Standard imports
 from __future__ import division
 import numpy as np
+# scipy is optional, it is only needed for sparse weight matrices
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
 
 # Local imports
 from pyrates.simobjects.simulation_object import MonitoredObject
 from pyrates.simobjects.groups.groups import Group
+from pyrates.simobjects.groups.unitgroups import IdentityGroup
 from pyrates.core.units import Distance, Speed, Time, TimeStep, time2tstep, mm
 from pyrates.utils.common_methods import check_argument_type
 
@@ -35,9 +41,58 @@ class Connection(MonitoredObject):
     - speed: if the distance is given in meters, the speed is in m/s
     - delay: is expressed in number of time steps for the information to travel
         down the connection
+    
+    The delayed outputs of the sending group are read in its OutputHistory,
+    a ring buffer shared by all the connections sending from the group and
+    sized to their longest delay.
+    - sparseWeights: True to store the weights as a sparse matrix in the CSR
+        format (requires scipy), False to store them as a dense array. By
+        default, a scipy.sparse weight matrix is kept sparse, and a dense one
+        is converted when less than sparseDensity of its weights are nonzero
+        and it has at least sparseMinSize weights.
+    
+    With sparse weights, the memory and the time of the execution scale with
+    the number of nonzero weights. The nonzero weights are fixed when the
+    connection is created. The monitor of the weights records their nonzero
+    values only, in the order of initialWeights.data in the saved data.
+    
+    In a batched simulation (see Simulation batchSize), the weights can be
+    given per instance with an array of shape (batchSize, receiving units,
+    sending units).
+    
+    The weights are cast to the dtype of the simulation (see Simulation dtype)
+    when the connection is created. The weight matrix given is kept as is if
+    it already has this dtype, unless the weights are dynamic: they are then
+    copied.
     """
     
     nodeLink = None
+    staticInputLink = None
+    
+    # True for the connections whose weights change during the simulation
+    dynamicWeights = False
+    
+    # True for the connections whose output is the weighted sum of the output
+    # of the sending group computed by method _project
+    linearOutput = True
+    
+    # Number of time steps of the projection of a static input computed at
+    # once, see method _precompute_projection
+    projectionChunkSize = 10000
+    
+    checkpointVars = ['weights', 'output']
+    
+    # True for the connections that can be executed at the same time as the
+    # other connections by a ThreadedPlan
+    parallelSafe = True
+    
+    # Automatic conversion of the weight matrices to the CSR format, see
+    # argument sparseWeights
+    sparseDensity = 0.1
+    sparseMinSize = 10000
+    
+    # False for the connections whose weights must be a dense array
+    sparseSupported = True
     
     def __init__(self,
                  sendingObj,
@@ -46,6 +101,7 @@ class Connection(MonitoredObject):
                  distance=0*mm,
                  speed=None, # 10 m/s for cortico-cortical connections?
                  delay=None,
+                 sparseWeights=None,
                  *args, **kwargs):
         
         (self.sendingGroup,
@@ -75,22 +131,69 @@ class Connection(MonitoredObject):
                       self.receivingGroup.shape[1],
                       self.sendingGroup.shape[0] * self.sendingGroup.shape[1]]
         
+        self.dtype = self.simulationRef.dtype
+        self.sparseWeights = False
+        self._set_weights(weightMatrix, sparseWeights)
+        
+        super(Connection, self).__init__(*args, **kwargs)
+    
+    def _set_weights(self, weightMatrix, sparseWeights):
+        '''Check the weight matrix given to the constructor and set the weights
+        of the connection.
+        '''
+        weightsShape = (self.receivingGroup.nbUnits, self.sendingGroup.nbUnits)
+        batchSize = self.simulationRef.batchSize
         if weightMatrix is None:
-            self.weights = np.zeros((self.receivingGroup.nbUnits,
-                                          self.sendingGroup.nbUnits))
+            self.weights = np.zeros(weightsShape, self.dtype)
         else:
-            if not isinstance(weightMatrix, np.ndarray):
+            if sparse is not None and sparse.issparse(weightMatrix):
+                if weightMatrix.shape != weightsShape:
+                    raise Exception, 'size of weights argument for '\
+                    + 'constructor Connection() must agree with the dimensions of '\
+                    + 'the NeuronGroup passed as argument'
+                self.weights = self._format_weights(weightMatrix, sparseWeights)
+            elif not isinstance(weightMatrix, np.ndarray):
                 raise Exception, 'argument weights argument for '\
                 + 'constructor Connection() must be a numpy array'
-            elif weightMatrix.shape != (self.receivingGroup.nbUnits,
-                                        self.sendingGroup.nbUnits):
+            elif weightMatrix.shape != weightsShape and (batchSize is None or \
+                    weightMatrix.shape != (batchSize,) + weightsShape):
                 raise Exception, 'size of weights argument for '\
                 + 'constructor Connection() must agree with the dimensions of '\
                 + 'the NeuronGroup passed as argument'
             else:
-                self.weights = weightMatrix
+                self.weights = self._format_weights(weightMatrix, sparseWeights)
+    
+    def _format_weights(self, weightMatrix, sparseWeights):
+        '''Return the weight matrix in the dtype of the simulation, as a CSR
+        matrix or a dense array (see argument sparseWeights).
+        '''
+        isSparse = sparse is not None and sparse.issparse(weightMatrix)
+        if sparseWeights is None:
+            sparseWeights = isSparse or (sparse is not None and \
+                weightMatrix.ndim == 2 and \
+                weightMatrix.size >= self.sparseMinSize and \
+                np.count_nonzero(weightMatrix) < \
+                    self.sparseDensity * weightMatrix.size)
+        if not self.sparseSupported:
+            sparseWeights = False
         
-        super(Connection, self).__init__(*args, **kwargs)
+        if sparseWeights:
+            if sparse is None:
+                raise ImportError, 'scipy is required for sparse weights'
+            if weightMatrix.ndim != 2:
+                msg = 'The weights of %s cannot be given per instance when '\
+                    + 'they are sparse'
+                raise ValueError, msg%str(self)
+            # Dynamic weights are copied, so that the matrix given is not
+            # changed by the simulation
+            weights = sparse.csr_matrix(weightMatrix, dtype=self.dtype,
+                                        copy=self.dynamicWeights)
+            weights.sum_duplicates()
+            self.sparseWeights = True
+            return weights
+        if isSparse:
+            return weightMatrix.toarray().astype(self.dtype, copy=False)
+        return weightMatrix.astype(self.dtype, copy=self.dynamicWeights)
     
     def get_weights_range(self):
         """Should be overridden if these default values are not true anymore"""
@@ -141,6 +244,8 @@ class Connection(MonitoredObject):
     
     def _initialize(self, deltat=None):
         
+        if deltat is None:
+            deltat = self.simulationRef.deltat
         if self.speed is not None:
             if deltat is None:
                 errMsg = "If you want to use speed of connection a deltat must"
@@ -150,25 +255,260 @@ class Connection(MonitoredObject):
                 self.delay = self.distance / self.speed
         
         if issubclass(type(self.delay), Time):
-            self.delay = time2tstep(self.delay, whoAsk=self.name)
-        
-        if self.delay is not None:
-            self.buffer = [np.zeros(self.sendingGroup.nbUnits) \
-                           for i in range(self.delay )]
+            self.delay = time2tstep(self.delay, whoAsk=self.name,
+                                    deltat=self.simulationRef.deltat)
+        if self.delay is None:
+            self.delaySteps = 0
+        elif isinstance(self.delay, TimeStep):
+            self.delaySteps = self.delay.value
         else:
-            self.buffer = []
+            self.delaySteps = int(self.delay)
         
-        self.buffer.append(self.sendingGroup.output)
-        self.output = np.dot(self.weights, self.buffer.pop(0))
+        self._project = self._select_projection()
+        
+        if self.delaySteps > 0:
+            self.senderHistory = self.sendingGroup._get_output_history(
+                self.delaySteps)
+            self.output = self._project(self.senderHistory.read(self.delaySteps))
+        else:
+            self.senderHistory = None
+            self.output = self._project(self.sendingGroup.output)
+        self.projection = None
+    
+    def _select_projection(self):
+        '''Return the method computing the weighted sum of the output of the
+        sending group, see method _project.
+        '''
+        if self.sparseWeights:
+            return self._sparse_dot
+        elif self.simulationRef.batchSize is None:
+            return self._dot
+        else:
+            return self._batch_dot
+    
+    def _execution_cost(self):
+        '''Return an estimate of the cost of the execution of the connection,
+        the number of weights used by the projection.
+        '''
+        if self.sparseWeights:
+            return self.weights.nnz
+        return np.size(self.weights)
+    
+    def _is_fusable(self):
+        '''Return True if the output of the connection is the product of its
+        dense weight matrix, shared by the instances of a batched simulation,
+        by the output of the sending group, so that an execution plan may
+        compute it together with the output of other connections (see
+        Simulation.run, argument fuseConnections).
+        Must be called after the initialization of the connection.
+        '''
+        return type(self)._execute.im_func is Connection._execute.im_func and \
+            self.linearOutput and not self.dynamicWeights and \
+            self.projection is None and np.ndim(self.weights) == 2 and \
+            self._project in (self._dot, self._batch_dot)
+    
+    def _has_static_sender(self):
+        '''Return True if the output of the sending group is known in advance
+        for every time step, i.e. it is the output group of a StaticInput.
+        '''
+        return not self.dynamicWeights and \
+            isinstance(self.sendingNode, self.staticInputLink) and \
+            isinstance(self.sendingGroup, IdentityGroup)
+    
+    def _precompute_projection(self):
+        '''Compute the output of the connection for all the time steps of the
+        static input sending to it, with one matrix product per chunk of
+        projectionChunkSize time steps instead of one per time step.
+        Must be called after the initialization of the nodes and connections.
+        '''
+        if not self._has_static_sender():
+            raise ValueError, 'Connection %s has no static sender'%str(self)
+        self.inputMatrix = self.sendingNode.flattenedInputMatrix
+        self.zeroOutput = np.zeros(np.shape(self.output), self.dtype)
+        self.projectionStart = 0
+        self.projection = self._project_block(
+            self.inputMatrix[0 : self.projectionChunkSize])
+    
+    def _project_block(self, senderOutputs):
+        '''Weighted sums of successive outputs of the sending group, the first
+        dimension of senderOutputs being the time steps.
+        '''
+        if self.sparseWeights:
+            return np.ascontiguousarray(self.weights.dot(senderOutputs.T).T)
+        if self.weights.ndim == 3:
+            return np.dot(senderOutputs, self.weights.transpose((0, 2, 1)))
+        return np.dot(senderOutputs, self.weights.T)
+    
+    def _read_projection(self, timeStep):
+        '''Set the output of the connection from the precomputed projection of
+        the static input.
+        '''
+        # Position in the delay queue of the output read at this time step: the
+        # queue starts with the output at initialization and the output at the
+        # first time step, both being the first row of the input. The sending
+        # node has then set row timeStep - 1 at time step timeStep.
+        position = timeStep - self.delaySteps
+        if position < 0:
+            self.output = self.zeroOutput
+            return
+        row = max(position - 2, 0)
+        if row >= self.inputMatrix.shape[0]:
+            self.output = self.zeroOutput
+            return
+        if not 0 <= row - self.projectionStart < self.projection.shape[0]:
+            self.projectionStart = row
+            self.projection = self._project_block(
+                self.inputMatrix[row : row + self.projectionChunkSize])
+        self.output = self.projection[row - self.projectionStart]
+    
+    def _dot(self, senderOutput):
+        '''Weighted sum of the output of the sending group'''
+        return np.dot(self.weights, senderOutput)
+    
+    def _sparse_dot(self, senderOutput):
+        '''Weighted sum of the output of the sending group with sparse weights.
+        The output of the sending group may have a batch dimension.
+        '''
+        if senderOutput.ndim == 1:
+            return self.weights.dot(senderOutput)
+        return self.weights.dot(senderOutput.T).T
+    
+    def _batch_dot(self, senderOutput):
+        '''Weighted sum of the output of the sending group in a batched
+        simulation. The output of the sending group and the weights may or may
+        not have a batch dimension.
+        '''
+        if self.weights.ndim == 3:
+            if senderOutput.ndim == 1:
+                return np.dot(self.weights, senderOutput)
+            return np.einsum('bij,bj->bi', self.weights, senderOutput)
+        elif senderOutput.ndim == 1:
+            return np.dot(self.weights, senderOutput)
+        return np.dot(senderOutput, self.weights.T)
     
     def _execute(self, timeStep):
         '''Basic execution of a connection.
-        Store the last output of the sending group in the delay queue and 
-        compute the output of the connection as the dot product of the first
-        element in the delay queue and the weight matrix of the connection.
+        Record the last output of the sending group in its history and compute
+        the output of the connection as the dot product of the output delay
+        time steps ago and the weight matrix of the connection.
         '''
-        self.buffer.append(self.sendingGroup.output)
-        self.output = np.dot(self.weights, self.buffer.pop(0))
+        if self.projection is not None:
+            self._read_projection(timeStep)
+            return
+        if self.delaySteps:
+            history = self.senderHistory
+            history.record(timeStep)
+            self.output = self._project(history.read(self.delaySteps))
+        else:
+            self.output = self._project(self.sendingGroup.output)
+
+    def _start_history(self, interpolate=True):
+        '''Replace the delay queue by a history of the outputs of the sending
+        group, read with method _execute_interpolated.
+        Must be called after the initialization of the connection.
+        
+        Arguments:
+        - interpolate: if False, the output read between two stored outputs is
+            the first one, for sending groups whose output only changes where
+            an output is stored (e.g. the output group of a StaticInput)
+        '''
+        # The output of the sending group at initialization is the output
+        # stored at time step 0
+        self.history = [(0, np.array(self.sendingGroup.output, copy=True))]
+        self.interpolateHistory = interpolate
+        self.zeroOutput = np.zeros(np.shape(self.output), self.dtype)
+
+    def _execute_interpolated(self, timeStep):
+        '''Execution of a delayed connection when the time steps are not
+        executed one by one (see pyrates.core.AdaptiveIntegrator).
+        The output of the sending group is stored in the history with its time
+        step, and the output of the connection is computed with the output of
+        the sending group delaySteps time steps ago, linearly interpolated
+        between the stored outputs (see _start_history). With steps of one time
+        step, it is the same output as with method _execute.
+        '''
+        history = self.history
+        history.append((timeStep, np.array(self.sendingGroup.output, copy=True)))
+        delayedStep = timeStep - self.delaySteps
+        if delayedStep < history[0][0]:
+            self.output = self.zeroOutput
+            return
+        # Drop the outputs that are not needed anymore
+        while history[1][0] <= delayedStep:
+            history.pop(0)
+        step0, output0 = history[0]
+        if step0 == delayedStep or not self.interpolateHistory:
+            senderOutput = output0
+        else:
+            step1, output1 = history[1]
+            weight = (delayedStep - step0) / (step1 - step0)
+            senderOutput = output0 + weight * (output1 - output0)
+        self.output = self._project(senderOutput)
+
+    def _monitor_value(self, var):
+        
+        if var == 'weights' and self.sparseWeights:
+            return self.weights.data
+        return super(Connection, self)._monitor_value(var)
+    
+    def _monitor_units(self, var):
+        
+        if var == 'weights':
+            if self.sparseWeights:
+                return tuple(self.weights.shape), 1
+            return tuple(np.shape(self.weights)[-2:]), 2
+        return tuple(self.receivingGroup.shape), 1
+    
+    def _monitor_positions(self, var, units):
+        
+        if var != 'weights' or not self.sparseWeights:
+            return units
+        # Position of each selected weight among the nonzero weights
+        indptr = self.weights.indptr
+        positions = []
+        for row, column in zip(*np.unravel_index(units, self.weights.shape)):
+            start = indptr[row]
+            found = np.flatnonzero(self.weights.indices[start : indptr[row + 1]] \
+                                   == column)
+            if len(found) == 0:
+                msg = 'The weight (%d, %d) of %s is zero, it is not stored by '\
+                    + 'the sparse weights and cannot be monitored'
+                raise ValueError, msg%(row, column, str(self))
+            positions.append(start + found[0])
+        return np.array(positions, dtype=int)
+    
+    def _checkpoint_state(self):
+        
+        state = super(Connection, self)._checkpoint_state()
+        if self.sparseWeights:
+            # The nonzero weights, the structure of the matrix does not change
+            state['weights'] = self.weights.data
+        # The delayed outputs of the sending group, oldest first
+        if self.delaySteps:
+            history = self.senderHistory
+            state['buffer'] = np.array([history.read(age) for age in \
+                                        range(self.delaySteps - 1, -1, -1)])
+            state['bufferTimeStep'] = np.array(history.timeStep)
+        return state
+    
+    def _restore_state(self, state):
+        
+        state = dict(state)
+        if 'buffer' in state:
+            buffer = state.pop('buffer')
+            if len(buffer) != self.delaySteps:
+                msg = 'The delay of connection %s is not the one of the '\
+                    + 'checkpoint'
+                raise ValueError, msg%str(self)
+            self.senderHistory.write(buffer, int(state.pop('bufferTimeStep')))
+        if 'weights' in state and self.sparseWeights:
+            weights = state.pop('weights')
+            if weights.shape != self.weights.data.shape:
+                msg = 'The nonzero weights of connection %s are not the ones '\
+                    + 'of the checkpoint'
+                raise ValueError, msg%str(self)
+            self.weights.data[...] = weights
+        super(Connection, self)._restore_state(state)
     
     def _saveddata(self):
 
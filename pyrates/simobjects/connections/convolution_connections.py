@@ -0,0 +1,150 @@
+"""Convolution connection
+
+A convolution connection connects two groups of the same 2D shape with a small
+kernel shared by all the units, instead of a weight matrix.
+  - ConvolutionConnection: the output is the 2D convolution of the output of
+    the sending group with the kernel.
+"""
+import numpy as np
+from connection import StaticConnection
+
+__all__ = ["ConvolutionConnection"]
+
+class ConvolutionConnection(StaticConnection):
+    """Connection whose output is the 2D convolution of the output of the
+    sending group, with its shape, with a kernel. The result is the one of a
+    Connection with the weight matrix
+    pyrates.utils.convolutionMask(sendingGroup.shape, kernel), without the
+    (nbUnits x nbUnits) matrix: the memory used is the one of the kernel and
+    the time of the execution scales with nbUnits times the size of the kernel.
+
+    Arguments:
+    - kernel: 2D array whose dimensions are odd, its center is the weight
+        between units at the same position. Units outside the group have a
+        zero output.
+    - method: 'direct' to add up the shifted outputs of the sending group
+        weighted by each nonzero element of the kernel, 'fft' to compute the
+        convolution with fast Fourier transforms, or 'auto' to use 'fft' when
+        the kernel has more than fftKernelSize nonzero elements
+    - the other arguments of Connection, except weightMatrix and sparseWeights
+
+    The kernel is the attribute weights of the connection, it is the weights
+    monitored and saved.
+    """
+
+    methods = ['auto', 'direct', 'fft']
+
+    # Number of nonzero elements of the kernel above which method 'auto' uses
+    # fast Fourier transforms
+    fftKernelSize = 32
+
+    def __init__(self, sendingObj, receivingObj, kernel=None, method='auto',
+                 *args, **kwargs):
+
+        if method not in self.methods:
+            raise ValueError, 'method argument must be one of %s'%str(self.methods)
+        self.method = method
+        super(ConvolutionConnection, self).__init__(sendingObj, receivingObj,
+                                                    weightMatrix=kernel,
+                                                    *args, **kwargs)
+
+    def _set_weights(self, kernel, sparseWeights):
+
+        if list(self.sendingGroup.shape) != list(self.receivingGroup.shape):
+            msg = 'The sending and receiving groups of %s must have the same '\
+                + 'shape'
+            raise ValueError, msg%str(self)
+        if not isinstance(kernel, np.ndarray) or kernel.ndim != 2:
+            raise TypeError, 'kernel argument must be a 2D numpy array'
+        if kernel.shape[0] % 2 != 1 or kernel.shape[1] % 2 != 1:
+            raise ValueError, 'the kernel shape must be odd on each dimension'
+        self.weights = kernel.astype(self.dtype, copy=False)
+
+    def _select_projection(self):
+
+        self.layerShape = tuple(self.sendingGroup.shape)
+        self.margins = ((self.weights.shape[0] - 1) // 2,
+                        (self.weights.shape[1] - 1) // 2)
+        method = self.method
+        if method == 'auto':
+            if np.count_nonzero(self.weights) > self.fftKernelSize:
+                method = 'fft'
+            else:
+                method = 'direct'
+
+        if method == 'fft':
+            height, width = self.layerShape
+            self.fftShape = (height + self.weights.shape[0] - 1,
+                             width + self.weights.shape[1] - 1)
+            self.kernelSpectrum = np.fft.rfft2(self.weights, self.fftShape)
+            return self._fft_convolve
+
+        # Position and value of the nonzero elements of the kernel
+        self.stencil = [(row, column, self.weights[row, column]) for \
+                        row, column in zip(*np.nonzero(self.weights))]
+        self.paddedOutput = None
+        return self._direct_convolve
+
+    def _execution_cost(self):
+
+        return self.sendingGroup.nbUnits * max(np.count_nonzero(self.weights), 1)
+
+    def _direct_convolve(self, senderOutput):
+        '''Convolution of the output of the sending group by addition of its
+        shifted copies. The first dimensions of senderOutput, if any, are
+        batch dimensions.
+        '''
+        leadShape = senderOutput.shape[:-1]
+        height, width = self.layerShape
+        rowMargin, columnMargin = self.margins
+        # The output of the sending group surrounded by zeros, allocated once
+        # for each shape of the output
+        padded = self.paddedOutput
+        if padded is None or padded.shape[:-2] != leadShape:
+            padded = np.zeros(leadShape + (height + 2 * rowMargin,
+                                           width + 2 * columnMargin),
+                              self.dtype)
+            self.paddedOutput = padded
+        padded[..., rowMargin : rowMargin + height,
+               columnMargin : columnMargin + width] = \
+            senderOutput.reshape(leadShape + (height, width))
+
+        output = np.zeros(leadShape + (height, width), self.dtype)
+        for row, column, value in self.stencil:
+            rowStart = 2 * rowMargin - row
+            columnStart = 2 * columnMargin - column
+            output += value * padded[..., rowStart : rowStart + height,
+                                     columnStart : columnStart + width]
+        return output.reshape(senderOutput.shape)
+
+    def _fft_convolve(self, senderOutput):
+        '''Convolution of the output of the sending group with fast Fourier
+        transforms. The first dimensions of senderOutput, if any, are batch
+        dimensions.
+        '''
+        leadShape = senderOutput.shape[:-1]
+        height, width = self.layerShape
+        rowMargin, columnMargin = self.margins
+        spectrum = np.fft.rfft2(senderOutput.reshape(leadShape + (height, width)),
+                                self.fftShape)
+        convolution = np.fft.irfft2(spectrum * self.kernelSpectrum, self.fftShape)
+        output = convolution[..., rowMargin : rowMargin + height,
+                             columnMargin : columnMargin + width]
+        return output.astype(self.dtype).reshape(senderOutput.shape)
+
+    def _project_block(self, senderOutputs):
+
+        return self._project(senderOutputs)
+
+    def _restore_state(self, state):
+
+        super(ConvolutionConnection, self)._restore_state(state)
+        # The kernel may have changed
+        self._project = self._select_projection()
+
+    def _saveddata(self):
+
+        savedData = super(ConvolutionConnection, self)._saveddata()
+        savedData.update({'kernel': self.weights,
+                          'method': self.method})
+        return savedData
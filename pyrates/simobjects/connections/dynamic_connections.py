@@ -14,6 +14,12 @@ __all__ = ["DynamicConnection", "DAModulatedConnection"]
 class DynamicConnection(Connection):
     """Base class for dynamic connections"""
     
+    dynamicWeights = True
+    # The plasticity functions work on dense weights
+    sparseSupported = False
+    # The plasticity function may use any object of the simulation
+    parallelSafe = False
+    
     def __init__(self, plasticityFunction=None,
                  dependentObjects=[],
                  *args, **kwargs):
@@ -43,13 +49,29 @@ class DAModulatedConnection(DynamicConnection):
     Weights between sending and receiving layers are modified depending on the
     reward contingency and the activity of the sending and receiving layers
     neurons.
+    The output of the connection is scaled down when it exceeds inputThreshold.
     
     Several parameters can be changed, the class cannot be used just as is
     
     Arguments:
     - taskNode: the object of the simulation that contain the reward
         contingency information
+    
+    In a batched simulation (see Simulation batchSize), C1, inputThreshold,
+    posReinforcement and negReinforcement can be given per instance with arrays
+    of shape (batchSize,), and the taskNode attributes reward and
+    changeWeightCondition can be boolean arrays of the same shape.
     """
+    # The output is normalized by its maximum value
+    linearOutput = False
+    
+    parallelSafe = True
+    
+    checkpointVars = Connection.checkpointVars + ['sendGrpActivity',
+                                                  'recGrpActivity',
+                                                  'DAModulation',
+                                                  'newWeights']
+    
     def __init__(self,
                  C1=0.00001,
                  inputThreshold=None,
@@ -64,17 +86,32 @@ class DAModulatedConnection(DynamicConnection):
         self.weightsSum = np.sum(self.weights)
         self.inputThreshold = inputThreshold
         self.C1 = C1
-        self.sendGrpActivity = np.zeros(self.sendingGroup.shape).flatten()
-        self.recGrpActivity = np.zeros(self.receivingGroup.shape).flatten()
+        self.sendGrpActivity = np.zeros(self.sendingGroup.nbUnits, self.dtype)
+        self.recGrpActivity = np.zeros(self.receivingGroup.nbUnits, self.dtype)
         self.posReinforcement = posReinforcement
         self.negReinforcement = negReinforcement
         
+        batchSize = self.simulationRef.batchSize
+        if batchSize is not None:
+            for param in ['C1', 'inputThreshold', 'posReinforcement',
+                          'negReinforcement']:
+                value = getattr(self, param)
+                if isinstance(value, (list, tuple, np.ndarray)):
+                    value = np.asarray(value, dtype=self.dtype)
+                    if value.shape != (batchSize,):
+                        msg = 'Parameter %s of %s must be a number or an array'
+                        msg += ' of shape (batchSize,)'
+                        raise ValueError, msg%(param, str(self))
+                    setattr(self, param, value)
+        
     def _initialize(self, deltat=None):
         
         super(DAModulatedConnection, self)._initialize(deltat=deltat)
-        self.sendGrpActivity = self.sendingGroup.output
-        self.recGrpActivity = self.receivingGroup.output
+        # Copies, the traces being updated in place
+        self.sendGrpActivity = np.array(self.sendingGroup.output, self.dtype)
+        self.recGrpActivity = np.array(self.receivingGroup.output, self.dtype)
         self.DAModulation = 1
+        self.newWeights = None
     
     def _execute(self, timeStep):
         
@@ -85,6 +122,16 @@ class DAModulatedConnection(DynamicConnection):
         the input the caudate receives are to high, thus decreasing the weights.
         Otherwise DAModulation is 1 and the weights are kept as they are.
         '''
+        if self.simulationRef.batchSize is not None:
+            # One modulation per instance
+            maxOutput = np.max(self.output, axis=-1)
+            overStimulated = maxOutput > self.inputThreshold
+            self.DAModulation = np.where(overStimulated,
+                                         self.inputThreshold / np.where(overStimulated, maxOutput, 1.),
+                                         1.)
+            self.output = self.output * np.expand_dims(self.DAModulation, -1)
+            return
+        
         if np.max(self.output) > self.inputThreshold:
             self.DAModulation = self.inputThreshold / np.max(self.output)
         else:
@@ -94,9 +141,15 @@ class DAModulatedConnection(DynamicConnection):
     
     def _da_function(self):
         
-        self.sendGrpActivity = self.sendGrpActivity * 0.9 + self.sendingGroup.output * 0.1
-        self.recGrpActivity = self.recGrpActivity * 0.9 + self.receivingGroup.output * 0.1
-        if self.taskNode.changeWeightCondition:
+        for trace, output in [(self.sendGrpActivity, self.sendingGroup.output),
+                              (self.recGrpActivity, self.receivingGroup.output)]:
+            trace *= 0.9
+            trace += output * 0.1
+        if self.simulationRef.batchSize is not None:
+            if np.any(self.taskNode.changeWeightCondition):
+                self._batch_update_weights(self.taskNode.reward,
+                                           self.taskNode.changeWeightCondition)
+        elif self.taskNode.changeWeightCondition:
             self._update_weights(self.taskNode.reward)
     
     def _update_weights(self, reward):
@@ -111,14 +164,12 @@ class DAModulatedConnection(DynamicConnection):
         else:
             dopamineActivity = self.negReinforcement
         
-        SGShape = [self.sendingGroup.nbUnits]
-        SGShape.insert(0, 1)
-        RGShape = [self.receivingGroup.nbUnits]
-        RGShape.append(1)
-        
         '''FiFjProduct represents the product of the activities of IT neurons and
-        caudate neurons'''
-        FiFjProduct = np.dot(self.recGrpActivity.reshape(RGShape), self.sendGrpActivity.reshape(SGShape)) * (self.weights != 0)
+        caudate neurons, computed for the nonzero weights only. The weights
+        may be replaced between the updates (e.g. by newWeights), the nonzero
+        ones are found at each update.'''
+        rows, columns = np.nonzero(self.weights)
+        FiFjProduct = self.recGrpActivity[rows] * self.sendGrpActivity[columns]
         
         '''New weigths are computed based on:
             - FiFjProduct: the recent activity of IT and caudate neurons, the
@@ -129,20 +180,66 @@ class DAModulatedConnection(DynamicConnection):
             - C1: a constant that defines how much the weights should be
                 modified, this constant is adapted to this particular task
         '''
-        self.newWeights = self.weights + self.DAModulation * dopamineActivity * self.C1 * FiFjProduct
+        newWeights = self.weights.copy()
+        newWeights[rows, columns] += self.DAModulation * dopamineActivity * self.C1 * FiFjProduct
         
         '''Here the weights are kept between the bounds of 0 and 1. So if a
         weight is lower than zero after modification, it is set to zero and if
         higher than one, set to one.
         '''
-        self.newWeights = self.newWeights * (self.newWeights > 0) * (self.newWeights < 1) + (self.newWeights >= 1) * 1
+        np.clip(newWeights, 0, 1, out=newWeights)
         
         '''Normalization of the weights for each neuron: one neuron should have
         the same weights so when a weight is strengthened other weights should
         be weakened. Conversely, if some weights are weakened, other weights are
-        strengthened.'''
-        for j in range(self.newWeights.shape[0]):
-            self.newWeights[:,j] = self.newWeights[:,j] * np.sum(self.newWeights[:,j])/ np.sum(self.weights[:,j])
+        strengthened. As in the original loop over the columns, only the
+        first nbUnits columns are normalized, nbUnits being the number of
+        receiving units.'''
+        columns = slice(0, newWeights.shape[0])
+        newWeights[:, columns] *= np.sum(newWeights[:, columns], axis=0)
+        newWeights[:, columns] /= np.sum(self.weights[:, columns], axis=0)
+        self.newWeights = newWeights
+    
+    def _batch_update_weights(self, reward, condition):
+        '''Batched version of _update_weights: the new weights of all the
+        instances are computed at once, and kept only for the instances whose
+        condition is True.
+        '''
+        dopamineActivity = np.where(reward, self.posReinforcement,
+                                    self.negReinforcement)
+        batchSize = self.simulationRef.batchSize
+        coefficient = self.DAModulation * dopamineActivity * self.C1
+        coefficient = np.broadcast_to(coefficient, (batchSize,))
+        
+        # The products of the activities for the nonzero weights only, shared
+        # by the instances or given per instance
+        newWeights = np.empty((batchSize,) + self.weights.shape[-2:],
+                              self.dtype)
+        newWeights[...] = self.weights
+        if self.weights.ndim == 3:
+            instances, rows, columns = np.nonzero(self.weights)
+            newWeights[instances, rows, columns] += coefficient[instances] * \
+                (self.recGrpActivity[instances, rows] * \
+                 self.sendGrpActivity[instances, columns])
+        else:
+            rows, columns = np.nonzero(self.weights)
+            newWeights[:, rows, columns] += coefficient[:, np.newaxis] * \
+                (self.recGrpActivity[:, rows] * self.sendGrpActivity[:, columns])
+        np.clip(newWeights, 0, 1, out=newWeights)
+        
+        # Same normalization as _update_weights, on the columns of every
+        # instance at once
+        columns = slice(0, newWeights.shape[-2])
+        normalized = newWeights[..., columns]
+        normalized *= np.sum(normalized, axis=-2)[..., np.newaxis, :]
+        normalized /= np.sum(self.weights[..., columns],
+                             axis=-2)[..., np.newaxis, :]
+        
+        condition = np.asarray(condition)
+        if condition.ndim == 1 and self.newWeights is not None:
+            newWeights = np.where(condition[:, np.newaxis, np.newaxis],
+                                  newWeights, self.newWeights)
+        self.newWeights = newWeights
         
     def _saveddata(self):
         
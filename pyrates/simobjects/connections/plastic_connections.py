@@ -0,0 +1,346 @@
+"""Plasticity rules and plastic connection
+
+A plasticity rule changes the weights of a connection from the traces of the
+outputs of its sending (pre) and receiving (post) groups, for all its weights
+at once. The rules work on dense and sparse (CSR) weights, the cost of an
+update scales with the number of nonzero weights.
+  - PlasticityRule: the base class for the plasticity rules
+  - HebbianRule: the weights grow with the product of the traces
+  - OjaRule: Hebbian rule with a decay keeping the weights bounded
+  - BCMRule: Hebbian rule with a sliding threshold on the post trace
+  - ThreeFactorRule: Hebbian rule modulated by a third factor, e.g. a reward
+  - PlasticConnection: dynamic connection whose weights are changed by a rule
+"""
+import numpy as np
+from dynamic_connections import DynamicConnection
+
+__all__ = ["PlasticityRule", "HebbianRule", "OjaRule", "BCMRule",
+           "ThreeFactorRule", "PlasticConnection"]
+
+class PlasticityRule(object):
+    """Base class for the plasticity rules.
+
+    Arguments:
+    - learningRate: the factor of the changes of the weights, in a batched
+        simulation it may be an array of shape (batchSize,)
+    - preTau: the time constant, in time steps, of the exponential trace of
+        the output of the sending group. With None, the trace is the output
+        itself.
+    - postTau: same as preTau for the output of the receiving group
+    - condition: function without argument called at each time step, the
+        weights are only updated when it returns True, e.g.
+        lambda: taskNode.changeWeightCondition. In a batched simulation, it
+        may return a boolean array of shape (batchSize,).
+    - interval: the weights are updated every interval time steps, when the
+        condition is True if any
+    - bounds: the (minimum, maximum) values of the weights after an update,
+        None for no bound
+
+    The traces are updated at each time step, the weights only when an update
+    is due. Only the nonzero weights of the connection are plastic, the other
+    ones stay zero. In a batched simulation, the weights must be given per
+    instance (see Connection).
+
+    Subclasses define method delta, and may add arrays to stateVars, the
+    variables saved in the checkpoints with the connection.
+    """
+
+    stateVars = ['preTrace', 'postTrace', 'stepCount']
+
+    def __init__(self, learningRate=0.01, preTau=None, postTau=None,
+                 condition=None, interval=1, bounds=(None, None)):
+
+        if condition is not None and not callable(condition):
+            raise TypeError, 'condition must be a function'
+        if int(interval) < 1:
+            raise ValueError, 'interval must be a positive number of time steps'
+        self.learningRate = learningRate
+        self.preTau = preTau
+        self.postTau = postTau
+        self.condition = condition
+        self.interval = int(interval)
+        self.bounds = tuple(bounds)
+        self.connection = None
+
+    def _initialize(self, connection):
+        '''Start the traces from the current outputs of the groups of the
+        connection and index its nonzero weights.
+        '''
+        if self.connection is not None and self.connection is not connection:
+            raise ValueError, 'A plasticity rule is used by one connection only'
+        self.connection = connection
+        self.preTrace = np.array(connection._sender_output(), connection.dtype)
+        self.postTrace = np.array(connection.receivingGroup.output,
+                                  connection.dtype)
+        self.stepCount = 0
+        self._index_synapses()
+
+    def _index_synapses(self):
+        '''Store the indices in the traces of the pre and post units of each
+        nonzero weight, in the order of the values of method _get_values.
+        '''
+        connection = self.connection
+        weights = connection.weights
+        batchSize = connection.simulationRef.batchSize
+        if connection.sparseWeights:
+            if batchSize is not None:
+                msg = 'The weights of %s must be given per instance to be '\
+                    + 'plastic in a batched simulation'
+                raise ValueError, msg%str(connection)
+            rows = np.repeat(np.arange(weights.shape[0]),
+                             np.diff(weights.indptr))
+            self.synapses = None
+            self.instances = None
+            self.postIndex = rows
+            self.preIndex = weights.indices.copy()
+        elif weights.ndim == 3:
+            self.synapses = np.nonzero(weights)
+            self.instances, rows, columns = self.synapses
+            self.postIndex = (self.instances, rows)
+            self.preIndex = (self.instances, columns)
+        elif batchSize is not None:
+            msg = 'The weights of %s must be given per instance to be '\
+                + 'plastic in a batched simulation'
+            raise ValueError, msg%str(connection)
+        else:
+            self.synapses = np.nonzero(weights)
+            self.instances = None
+            self.postIndex, self.preIndex = self.synapses
+
+    def _get_values(self):
+        '''Return the plastic weights, as a 1D array'''
+        if self.synapses is None:
+            return self.connection.weights.data
+        return self.connection.weights[self.synapses]
+
+    def _set_values(self, values):
+
+        if self.synapses is None:
+            self.connection.weights.data[...] = values
+        else:
+            self.connection.weights[self.synapses] = values
+
+    def _per_synapse(self, value):
+        '''Return value, a number or an array of shape (batchSize,), for each
+        plastic weight.'''
+        if np.ndim(value) == 0 or self.instances is None:
+            return value
+        return np.asarray(value)[self.instances]
+
+    def update_traces(self):
+        '''Move the traces toward the current outputs of the groups'''
+        for trace, output, tau in [
+                (self.preTrace, self.connection._sender_output(), self.preTau),
+                (self.postTrace, self.connection.receivingGroup.output,
+                 self.postTau)]:
+            if tau is None:
+                trace[...] = output
+            else:
+                trace += (output - trace) / tau
+
+    def update(self):
+        '''Update the traces, then the weights if an update is due. Called by
+        the connection at each time step.
+        '''
+        self.update_traces()
+        self.stepCount += 1
+        if self.stepCount % self.interval != 0:
+            return
+        active = True
+        if self.condition is not None:
+            active = self.condition()
+            if not np.any(active):
+                return
+
+        weights = self._get_values()
+        change = self.delta(self.preTrace[self.preIndex],
+                            self.postTrace[self.postIndex], weights)
+        change *= self._per_synapse(self.learningRate)
+        if np.ndim(active) > 0:
+            change *= self._per_synapse(active)
+        newWeights = weights + change
+        minimum, maximum = self.bounds
+        if minimum is not None or maximum is not None:
+            np.clip(newWeights, minimum, maximum, out=newWeights)
+        self._set_values(newWeights)
+
+    def delta(self, pre, post, weights):
+        '''Return the change of the plastic weights for a learning rate of 1.
+
+        Arguments:
+        - pre: the pre trace of each plastic weight
+        - post: the post trace of each plastic weight
+        - weights: the plastic weights
+        The arrays have one element per plastic weight. The array returned may
+        be modified.
+        '''
+        raise NotImplementedError
+
+    def _saveddata(self):
+
+        return {'class': str(type(self)),
+                'learningRate': self.learningRate,
+                'preTau': self.preTau,
+                'postTau': self.postTau,
+                'interval': self.interval,
+                'bounds': self.bounds}
+
+class HebbianRule(PlasticityRule):
+    """Hebbian rule: each weight changes by learningRate * pre * post"""
+
+    def delta(self, pre, post, weights):
+
+        return pre * post
+
+class OjaRule(PlasticityRule):
+    """Oja's rule: each weight changes by
+    learningRate * post * (pre - post * weight), the decay keeping the norm of
+    the weights of a receiving unit bounded.
+    """
+
+    def delta(self, pre, post, weights):
+
+        return post * (pre - post * weights)
+
+class BCMRule(PlasticityRule):
+    """Bienenstock-Cooper-Munro rule: each weight changes by
+    learningRate * pre * post * (post - threshold), the threshold of each
+    receiving unit being a trace of the square of its output.
+
+    Arguments:
+    - thresholdTau: the time constant, in time steps, of the threshold trace
+    - initialThreshold: the value of the thresholds at initialization
+    - the arguments of PlasticityRule
+    """
+
+    stateVars = PlasticityRule.stateVars + ['threshold']
+
+    def __init__(self, thresholdTau=100., initialThreshold=0., *args, **kwargs):
+
+        super(BCMRule, self).__init__(*args, **kwargs)
+        self.thresholdTau = thresholdTau
+        self.initialThreshold = initialThreshold
+
+    def _initialize(self, connection):
+
+        super(BCMRule, self)._initialize(connection)
+        self.threshold = np.empty_like(self.postTrace)
+        self.threshold.fill(self.initialThreshold)
+
+    def update_traces(self):
+
+        super(BCMRule, self).update_traces()
+        output = self.connection.receivingGroup.output
+        self.threshold += (output * output - self.threshold) / self.thresholdTau
+
+    def delta(self, pre, post, weights):
+
+        return pre * post * (post - self.threshold[self.postIndex])
+
+    def _saveddata(self):
+
+        savedData = super(BCMRule, self)._saveddata()
+        savedData.update({'thresholdTau': self.thresholdTau,
+                          'initialThreshold': self.initialThreshold})
+        return savedData
+
+class ThreeFactorRule(PlasticityRule):
+    """Reward-modulated Hebbian rule: each weight changes by
+    learningRate * modulator() * pre * post, the traces acting as eligibility
+    traces, e.g. for a dopamine signal given by a task node.
+
+    Arguments:
+    - modulator: function without argument returning the third factor, a
+        number or, in a batched simulation, an array of shape (batchSize,)
+    - the arguments of PlasticityRule, the condition typically being the end
+        of a trial
+    """
+
+    def __init__(self, modulator=None, *args, **kwargs):
+
+        if not callable(modulator):
+            raise TypeError, 'modulator must be a function'
+        super(ThreeFactorRule, self).__init__(*args, **kwargs)
+        self.modulator = modulator
+
+    def delta(self, pre, post, weights):
+
+        change = pre * post
+        change *= self._per_synapse(self.modulator())
+        return change
+
+class PlasticConnection(DynamicConnection):
+    """Connection whose weights are changed at each time step by a plasticity
+    rule, before the computation of its output.
+
+    Arguments:
+    - rule: the PlasticityRule instance changing the weights, used by this
+        connection only
+    - the arguments of Connection, the weights can be sparse
+
+    The pre trace follows the output of the sending group read with the delay
+    of the connection. The condition and the modulator of the rule must only
+    read variables that do not change during the execution of the connections
+    (e.g. attributes of a task node), so that the connection can be executed
+    in parallel with the other connections.
+    """
+
+    sparseSupported = True
+    parallelSafe = True
+
+    def __init__(self, sendingObj, receivingObj, rule=None, *args, **kwargs):
+
+        if not isinstance(rule, PlasticityRule):
+            raise TypeError, 'rule argument must be a PlasticityRule instance'
+        self.rule = rule
+        super(PlasticConnection, self).__init__(plasticityFunction=rule.update,
+                                                sendingObj=sendingObj,
+                                                receivingObj=receivingObj,
+                                                *args, **kwargs)
+
+    def _initialize(self, deltat=None):
+
+        super(PlasticConnection, self)._initialize(deltat=deltat)
+        self.rule._initialize(self)
+
+    def _sender_output(self):
+        '''Return the output of the sending group delaySteps time steps ago'''
+        if self.delaySteps:
+            return self.senderHistory.read(self.delaySteps)
+        return self.sendingGroup.output
+
+    def _execute(self, timeStep):
+
+        # The delayed output read by the rule is the one of this time step
+        if self.delaySteps:
+            self.senderHistory.record(timeStep)
+        super(PlasticConnection, self)._execute(timeStep)
+
+    def _checkpoint_state(self):
+
+        state = super(PlasticConnection, self)._checkpoint_state()
+        for var in self.rule.stateVars:
+            state['rule.' + var] = np.asarray(getattr(self.rule, var))
+        return state
+
+    def _restore_state(self, state):
+
+        state = dict(state)
+        for var in self.rule.stateVars:
+            value = state.pop('rule.' + var, None)
+            if value is not None:
+                if value.ndim == 0:
+                    value = value.item()
+                else:
+                    value = value.copy()
+                setattr(self.rule, var, value)
+        super(PlasticConnection, self)._restore_state(state)
+        # The weights may have changed
+        self.rule._index_synapses()
+
+    def _saveddata(self):
+
+        savedData = super(PlasticConnection, self)._saveddata()
+        savedData.update({'plasticityFunction': 'PlasticityRule',
+                          'rule': self.rule._saveddata()})
+        return savedData
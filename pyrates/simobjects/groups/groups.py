@@ -10,7 +10,7 @@ import numpy as np
 # Local import
 from pyrates.simobjects.simulation_object import MonitoredObject
 
-__all__ = ["Group"]
+__all__ = ["Group", "OutputHistory"]
 
 class Group(MonitoredObject):
     """Base class of all groups
@@ -30,10 +30,17 @@ class Group(MonitoredObject):
         output can take. Important for visualization purpose only.
     - parentNode: the parent node containing the newly created group. If no
         parent node is created, one will be automatically created.
+    
+    In a batched simulation (see Simulation batchSize) the variables of the
+    group have the shape (batchSize, nbUnits) given by attribute varShape.
+    Their floating-point type is the dtype of the simulation, given by
+    attribute dtype.
     """
     
     singleGrpNodeLink = None
     
+    checkpointVars = ['output', 'state', 'input']
+    
     def __init__(self,
                  shape=None,
                  nbUnits=None,
@@ -57,7 +64,22 @@ class Group(MonitoredObject):
                                                 **parentNodeKwargs)
             self.parentNode = sgGrpNode
         
-        self.output = np.zeros(self.nbUnits)
+        batchSize = self.simulationRef.batchSize
+        if batchSize is None:
+            self.varShape = (self.nbUnits,)
+        else:
+            self.varShape = (batchSize, self.nbUnits)
+        
+        self.dtype = self.simulationRef.dtype
+        self.output = np.zeros(self.varShape, self.dtype)
+        
+        # Set to True when the variables of the group are views into a state
+        # slab of the simulation, they must then be updated in place
+        self.inPlace = False
+        
+        # History of the output read by the delayed connections, see method
+        # _get_output_history
+        self.outputHistory = None
         
         self.weightsRange = outputRange
         
@@ -73,11 +95,19 @@ class Group(MonitoredObject):
         '''Return the list of variable that can be monitored'''
         return ['output', 'input']
     
+    def _monitor_units(self, var):
+        
+        # The variables have one flat dimension of units, in the shape of the
+        # group
+        return tuple(self.shape), 1
+    
     def _initialize(self):
         """ Set parameters before running the simulation.
         
         This method needs to be overridden by subclasses in some cases. 
         """
+        # The delayed connections allocate a new history at each run
+        self.outputHistory = None
         self._add_up_inputs()
 #        super(Group, self)._initialize()
 #        if self.isMonitored:
@@ -103,12 +133,88 @@ class Group(MonitoredObject):
         
         self.incoming_Cs.append(connection)
     
+    def _get_output_history(self, delay):
+        '''Return the history of the output of the group shared by the
+        connections sending from it with a delay, with room for delay time
+        steps. Must be called by the connections when they are initialized.
+        '''
+        if self.outputHistory is None:
+            self.outputHistory = OutputHistory(self, delay)
+        elif delay > self.outputHistory.maxDelay:
+            self.outputHistory.allocate(delay)
+        return self.outputHistory
+    
     def _add_up_inputs(self):
-
-        self.input = np.zeros(self.nbUnits)
+        
+        if self.inPlace:
+            self.input.fill(0)
+        else:
+            self.input = np.zeros(self.varShape, self.dtype)
         for connection in self.incoming_Cs:
             self.input += connection.output
     
+    def _input_kernel(self):
+        '''Return a function that sums up the inputs of the group in place, in
+        an input vector allocated once. Used by the compiled execution plan.
+        '''
+        if not self.inPlace:
+            self.input = np.zeros(np.shape(self.input), self.dtype)
+        inputVector = self.input
+        connections = tuple(self.incoming_Cs)
+        
+        def add_up_inputs():
+            inputVector.fill(0)
+            for connection in connections:
+                np.add(inputVector, connection.output, out=inputVector)
+        
+        return add_up_inputs
+    
+    def _bind_slab(self, output, state, input_):
+        '''Replace the output, state and input of the group by views into the
+        buffers of a state slab (see pyrates.core.StateSlab). The current values
+        are copied in the views and the group is then updated in place.
+        '''
+        output[...] = self.output
+        self.output = output
+        if self.outputHistory is not None:
+            self.outputHistory.match_output()
+        if hasattr(self, 'state'):
+            state[...] = self.state
+        self.state = state
+        if hasattr(self, 'input'):
+            input_[...] = self.input
+        self.input = input_
+        self.inPlace = True
+    
+    def _assign_state(self, state):
+        '''Set the state of the group, in place if the group is bound to a state
+        slab.
+        '''
+        if self.inPlace:
+            self.state[...] = state
+        else:
+            self.state = np.asarray(state, self.dtype)
+    
+    def _assign_output(self, output):
+        '''Set the output of the group, in place if the group is bound to a
+        state slab.
+        '''
+        if self.inPlace:
+            self.output[...] = output
+        else:
+            self.output = np.asarray(output, self.dtype)
+    
+    def _restore_state(self, state):
+        
+        state = dict(state)
+        if 'output' in state:
+            self._assign_output(state.pop('output').copy())
+        if 'state' in state:
+            self._assign_state(state.pop('state').copy())
+        if 'input' in state and self.inPlace:
+            self.input[...] = state.pop('input')
+        super(Group, self)._restore_state(state)
+    
     def get_incoming_cs_names(self):
         '''Returns the incoming connections of the group'''
         outputList = []
@@ -125,11 +231,11 @@ class Group(MonitoredObject):
                 if state.shape != self.shape:
                     raise Exception, 'The shape of the new state must have the shape of the group'
                 else:
-                    self.state = state
+                    self._assign_state(state)
             else:
                 raise TypeError, 'state argument of function set_state must be either an integer, float or ndarray'
         else:
-            self.state = np.zeros(self.nbUnits)
+            self._assign_state(np.zeros(self.varShape, self.dtype))
             
     def set_output(self, output = None):
         # The default option without providing an argument will reset the units output to zero
@@ -140,11 +246,11 @@ class Group(MonitoredObject):
                 if output.shape != self.shape:
                     raise Exception, 'The shape of the new state must have the shape of the group'
                 else:
-                    self.output = output
+                    self._assign_output(output)
             else:
                 raise TypeError, 'state argument of function set_state must be either an integer, float or ndarray'
         else:
-            self.output = np.zeros(self.nbUnits)
+            self._assign_output(np.zeros(self.varShape, self.dtype))
     
     def _saveddata(self):
         """Save name and shape of the group"""
@@ -163,7 +269,8 @@ class Group(MonitoredObject):
     
     def __getitem__(self, item):
         """Return the state of the units"""
-        return self.output.reshape(self.shape)[item]
+        shape = list(np.shape(self.output)[:-1]) + list(self.shape)
+        return self.output.reshape(shape)[item]
     
 def check_shape_nbunits(shape, nbUnits):
     
@@ -180,4 +287,76 @@ def check_shape_nbunits(shape, nbUnits):
     else:
         shape = [1, nbUnits]
     
-    return shape, nbUnits
\ No newline at end of file
+    return shape, nbUnits
+
+
+class OutputHistory(object):
+    '''Ring buffer of the last outputs of a group, shared by the connections
+    reading it with a delay.
+    
+    Arguments:
+    - group: the group whose output is recorded
+    - maxDelay: the longest delay, in time steps, read in the history
+    
+    The output of the group at time step t is copied in the row t % size of
+    the buffer, size being maxDelay + 1, so that the buffer is allocated once
+    and the outputs older than maxDelay time steps are overwritten. The rows of
+    the time steps before the initialization are zeros.
+    '''
+    
+    def __init__(self, group, maxDelay):
+        
+        self.group = group
+        self.allocate(maxDelay)
+    
+    def allocate(self, maxDelay):
+        '''Allocate the buffer for maxDelay time steps and record the current
+        output of the group as the output at time step 0.
+        '''
+        self.maxDelay = maxDelay
+        self.size = maxDelay + 1
+        output = self.group.output
+        self.buffer = np.zeros((self.size,) + np.shape(output), self.group.dtype)
+        self.buffer[0] = output
+        self.head = 0
+        self.timeStep = 0
+    
+    def match_output(self):
+        '''Give the buffer the shape of the output of the group, after the
+        output was replaced, e.g. by a view into a batched state slab. The
+        outputs recorded are broadcast to the new shape.
+        '''
+        shape = np.shape(self.group.output)
+        if self.buffer.shape[1:] == shape:
+            return
+        rowShape = self.buffer.shape[1:]
+        leadShape = (1,) * (len(shape) - len(rowShape))
+        buffer = np.zeros((self.size,) + shape, self.buffer.dtype)
+        buffer[...] = self.buffer.reshape((self.size,) + leadShape + rowShape)
+        self.buffer = buffer
+    
+    def record(self, timeStep):
+        '''Copy the output of the group at timeStep in the buffer. The output is
+        copied once per time step whatever the number of connections calling
+        the method, including from several threads.
+        '''
+        if timeStep != self.timeStep:
+            head = timeStep % self.size
+            self.buffer[head] = self.group.output
+            self.head = head
+            self.timeStep = timeStep
+    
+    def read(self, delay):
+        '''Return the output of the group delay time steps before the last
+        recorded time step.
+        '''
+        return self.buffer[(self.head - delay) % self.size]
+    
+    def write(self, outputs, timeStep):
+        '''Set the outputs of the group up to timeStep, outputs being the last
+        outputs recorded, oldest first, e.g. from a checkpoint.
+        '''
+        for age, output in enumerate(outputs[::-1]):
+            self.buffer[(timeStep - age) % self.size] = output
+        self.head = timeStep % self.size
+        self.timeStep = timeStep
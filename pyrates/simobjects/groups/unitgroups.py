@@ -15,7 +15,7 @@ from __future__ import division
 import numpy as np
 
 # Local imports
-from pyrates.utils.common_methods import typeAndSize
+from pyrates.utils.common_methods import typeAndSize, checkIfInOptionList
 from groups import Group
 
 __all__ = ["IdentityGroup", "ActivatedGroup",
@@ -34,12 +34,15 @@ class IdentityGroup(Group):
         
     def _initialize(self):
         
-        self.output = self.state
+        self._assign_output(self.state)
         super(IdentityGroup, self)._initialize()
         
     def _execute(self, timeStep):
         
-        self.output = self.state
+        if self.inPlace:
+            self.output[...] = self.state
+        else:
+            self.output = self.state
     
 class ActivatedGroup(Group):
     """UG where the output is the result of the state through an activation
@@ -59,7 +62,7 @@ class ActivatedGroup(Group):
         
         super(ActivatedGroup, self).__init__(*args, **kwargs)
         
-        self.state = np.zeros(self.nbUnits)
+        self.state = np.zeros(self.varShape, self.dtype)
         
         self.activationParams = activationParams
         self.activationFunction = activationClass.get_function(activationParams)
@@ -73,14 +76,18 @@ class ActivatedGroup(Group):
     
     def _initialize(self):
         
-        self.output = self.activationFunction(self.state)
+        self._assign_output(self.activationFunction(self.state))
         super(ActivatedGroup, self)._initialize()
     
     def _execute(self, timeStep):
         """Compute the output with the integration of the state with the
         activation function.
         """
-        self.output = self.activationFunction(self.state)
+        if self.inPlace:
+            self.output[...] = self.activationFunction(self.state)
+        else:
+            self.output = np.asarray(self.activationFunction(self.state),
+                                     self.dtype)
     
     def _saveddata(self):
         
@@ -100,20 +107,39 @@ class LeakyIntegrator(ActivatedGroup):
     - tau: time constant of the leaky integration in milliseconds
     - tauStep: time constant of the leaky integration in time steps
     - restingState: state of the group when the are no inputs 
+    - integrator: the method solving the leaky integration, 'euler' (forward
+        Euler, the default) or 'exponential' (exact exponential decay for an
+        input constant over a time step, stable for any deltat). It is
+        ignored, with a warning, when the simulation is run with a network
+        integrator (see Simulation.run, argument integrator).
+    
+    The time constants can be a single number, or an array with the shape of
+    the group for one time constant per unit. In a batched simulation, they can
+    also be given per instance with an array of shape (batchSize,) or
+    (batchSize,) + shape.
     
     Methods
     - usual group methods (see Group class for more details)
     - set_state: overriden: reset the state to resting_state if no value is specified
     """
     
+    integrators = ['euler', 'exponential']
+    
     def __init__(self,
                  tau=None,
                  tauStep=None,
                  restingState=None,
+                 integrator='euler',
                  *args, **kwargs):
         
         super(LeakyIntegrator, self).__init__(*args, **kwargs)
         
+        try:
+            self.integrator = checkIfInOptionList(integrator, self.integrators)
+        except (TypeError, ValueError):
+            msg = 'integrator argument must be one of %s'%str(self.integrators)
+            raise ValueError, msg
+        
         # Check tau and tauStep arguments
         if tauStep is not None and tau is not None:
             raise Exception, 'You cant define a time constant "tau" in terms of simulated time and at the same time\na time constant "tauStep" in terms of time_steps'
@@ -122,10 +148,7 @@ class LeakyIntegrator(ActivatedGroup):
         
         if tau is not None:
             if isinstance(tau, np.ndarray):
-                if tau.shape != tuple(self.shape):
-                    raise Exception, 'If you want to specify a time constant for each neuron, make sure the matrix has the size of the layer'
-                else:
-                    tau = tau.flatten()
+                tau = self._check_time_constant(tau)
             elif not isinstance(tau, int) and not isinstance(tau, float):
                 raise Exception, 'Tau must be a single number or array of numbers'
             self.tau = tau
@@ -133,27 +156,41 @@ class LeakyIntegrator(ActivatedGroup):
 
         else:
             if isinstance(tauStep, np.ndarray):
-                if tauStep.shape != self.shape:
-                    raise ValueError, 'If you want to specify a time constant for each neuron, make sure the matrix has the size of the layer'
-                else:
-                    tauStep = tauStep.flatten()
-            elif isinstance(tauStep, int) or isinstance(tauStep, float):
+                tauStep = self._check_time_constant(tauStep)
+            elif not isinstance(tauStep, int) and not isinstance(tauStep, float):
                 raise Exception, 'Tau_step must be a single number or array of numbers'
             self.tauStep = tauStep
             self.tau = None
         
         # Check resting state argument
         if restingState == None:
-            self.restingState = np.zeros(self.nbUnits)
+            self.restingState = np.zeros(self.nbUnits, self.dtype)
         elif isinstance(restingState, int) or isinstance(restingState, float):
-            self.restingState = np.ones(self.nbUnits) * restingState
+            self.restingState = np.ones(self.nbUnits, self.dtype) * restingState
         elif isinstance(restingState, np.ndarray):
             try:
-                self.restingState = (typeAndSize(restingState, np.ndarray, self.shape)).flatten()
+                self.restingState = (typeAndSize(restingState, np.ndarray, self.shape)).flatten().astype(self.dtype)
             except:
                 raise Exception, 'If the resting state is a matrix (each unit has its resting state), be sure the size of the matrix corresponds to the size of the group'
             
         self.state = self.restingState
+        if len(self.varShape) == 2:
+            self.state = np.tile(self.restingState, (self.varShape[0], 1))
+    
+    def _check_time_constant(self, timeConstant):
+        '''Check the shape of an array of time constants and return it with a
+        shape that broadcasts with the state of the group.
+        '''
+        batchSize = self.simulationRef.batchSize
+        if timeConstant.shape == tuple(self.shape):
+            return timeConstant.flatten()
+        elif batchSize is not None and timeConstant.shape == (batchSize,):
+            return timeConstant.reshape((batchSize, 1))
+        elif batchSize is not None and \
+                timeConstant.shape == tuple([batchSize] + list(self.shape)):
+            return timeConstant.reshape(self.varShape)
+        else:
+            raise ValueError, 'If you want to specify a time constant for each neuron, make sure the matrix has the size of the layer'
         
     def _initialize(self):
         """
@@ -175,33 +212,61 @@ class LeakyIntegrator(ActivatedGroup):
                 print "'" + str(self) + "'" + ' has a time constant of ' + str(self.tauStep) + ' steps'
         elif self.tau is None and deltat is not None:
             self.tau = self.tauStep * deltat
+        self.invTauStep = 1. / self.tauStep
+        if isinstance(self.invTauStep, np.ndarray):
+            # Keeps the integration in the dtype of the simulation
+            self.invTauStep = self.invTauStep.astype(self.dtype)
+        # Fraction of the distance to the target state (input + resting state)
+        # covered in one time step
+        if self.integrator == 'exponential':
+            self.integrationGain = -np.expm1(-self.invTauStep)
+        else:
+            self.integrationGain = self.invTauStep
         super(LeakyIntegrator, self)._initialize()
     
+    def _bind_slab(self, output, state, input_):
+        
+        super(LeakyIntegrator, self)._bind_slab(output, state, input_)
+        # Buffer of the in place computation of the state variation
+        self.deltaState = np.empty_like(state)
+    
     def _execute(self, timeStep):
         """
         Here is the leaky integration (read 'D' as 'delta'):
                    1                    where m is the membrane potential ('state' variable here) 
         Dm / Dt = --- * (input - m)     t is the time, T is time constant tau
                    T                    
-        This differential equation is solved with the Euler method (discretization of time)
+        This differential equation is solved with the Euler method (discretization of time):
+        m <- m + (input - m) / T
+        or, with the 'exponential' integrator, with its exact solution for an
+        input constant during the time step:
+        m <- m + (input - m) * (1 - exp(-1 / T))
         """
         
-        deltaState =  (1. / self.tauStep) * (self.input + self.restingState - self.state)
-        
-        self.state = self.state + deltaState
+        if self.inPlace:
+            deltaState = self.deltaState
+            np.add(self.input, self.restingState, out=deltaState)
+            deltaState -= self.state
+            deltaState *= self.integrationGain
+            self.state += deltaState
+        else:
+            deltaState =  self.integrationGain * (self.input + self.restingState - self.state)
+            
+            self.state = self.state + deltaState
         super(LeakyIntegrator, self)._execute(timeStep)
         
     def set_state(self, state = None):
         
         if state is None:
-            self.state = self.restingState
+            self._assign_state(self.restingState)
         else:
             super(LeakyIntegrator, self).set_state(state = state)
             
     def _saveddata(self):
         savedData = super(LeakyIntegrator, self)._saveddata()
         savedData.update({'tau': self.tau,
-                          'tauStep': self.tauStep})
+                          'tauStep': self.tauStep,
+                          'integrator': self.integrator})
         return savedData
 
 # TODO: class OgerLikeLeakyNeurons must be updated
@@ -70,6 +70,8 @@ class StaticInput(InputGroup):
                 [10,2] at time step 452.
     """
     
+    parallelSafe = True
+    
     def __init__(self,
                  inputMatrix,
                  groupArgs={},
@@ -109,18 +111,36 @@ class StaticInput(InputGroup):
         matrix in order to use it as any other unit group.
         """
         self.flattenedInputMatrix = np.zeros((self.nbTimeStepsSim,
-                                              self.outputGroup.nbUnits))
+                                              self.outputGroup.nbUnits),
+                                             self.outputGroup.dtype)
         for i in range(self.nbTimeStepsSim):
             self.flattenedInputMatrix[i,:] = np.ravel(self.inputMatrix[i])
-        self.outputGroup.state = self.flattenedInputMatrix[0,:]
+        self.outputGroup._assign_state(self.flattenedInputMatrix[0,:])
+        self.changeSteps = None
         super(StaticInput, self)._initialize()
     
+    def get_next_change(self, timeStep):
+        
+        if self.changeSteps is None:
+            # The row set at time step t is row t - 1, and the output falls to
+            # zero after the last row
+            inputMatrix = self.flattenedInputMatrix
+            changed = np.any(inputMatrix[1:] != inputMatrix[:-1], axis=1)
+            changeSteps = list(np.nonzero(changed)[0] + 2)
+            if np.any(inputMatrix[-1] != 0):
+                changeSteps.append(self.nbTimeStepsSim + 1)
+            self.changeSteps = np.array(changeSteps, dtype=int)
+        index = np.searchsorted(self.changeSteps, timeStep)
+        if index == len(self.changeSteps):
+            return None
+        return int(self.changeSteps[index])
+    
     def _execute(self, timeStep):
         
         try:
-            self.outputGroup.state = self.flattenedInputMatrix[timeStep-1]
+            self.outputGroup._assign_state(self.flattenedInputMatrix[timeStep-1])
         except IndexError:
-            self.outputGroup.state = np.zeros(self.outputGroup.nbUnits)
+            self.outputGroup._assign_state(np.zeros(self.outputGroup.nbUnits))
         super(StaticInput, self)._execute(timeStep)
         
     def _saveddata(self):
@@ -200,15 +220,15 @@ class NoiseGenerator(InputGroup):
     
     def _execute_uniform(self):
         
-        self.outputGroup.state = np.random.uniform(self.min,
-                                                   self.max,
-                                                   self.outputGroup.nbUnits)
+        self.outputGroup._assign_state(np.random.uniform(self.min,
+                                                         self.max,
+                                                         self.outputGroup.varShape))
         
     def _execute_normal(self, timeStep):
         
-        self.outputGroup.state = np.random.normal(self.mean,
-                                                  self.std_deviation,
-                                                  self.outputGroup.nbUnits)
+        self.outputGroup._assign_state(np.random.normal(self.mean,
+                                                        self.std_deviation,
+                                                        self.outputGroup.varShape))
     
     def __getitem__(self, item):
         # Return the state of the units
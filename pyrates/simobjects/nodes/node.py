@@ -13,6 +13,15 @@ __all__ = ["Node", "SingleGrpNode"]
 class Node(SimulationObject):
     '''Basic class for nodes, must be overridden'''
     
+    # True for the nodes whose execution is the execution of their output
+    # group, which can then be integrated by a network integrator
+    integrable = False
+    
+    # True for the nodes that can be executed at the same time as the other
+    # nodes by a ThreadedPlan: they only read the input and the state of their
+    # own groups
+    parallelSafe = False
+    
     def __init__(self,
                  inputGroup=None,
                  outputGroup=None,
@@ -34,6 +43,15 @@ class Node(SimulationObject):
         '''Must be overridden'''
         raise NotImplementedError
     
+    def get_next_change(self, timeStep):
+        '''Return the first time step, from timeStep on, at which the execution
+        of the node changes its output, or None if it never changes. It limits
+        the steps of an adaptive integrator (see pyrates.core.AdaptiveIntegrator)
+        which executes the node once per step. By default the output may change
+        at every time step.
+        '''
+        return timeStep
+    
     def _saveddata(self):
         
         savedData = super(Node, self)._saveddata()
@@ -52,6 +70,10 @@ class Node(SimulationObject):
 class SingleGrpNode(Node):
     '''This type of Node was developed to encapsulate single groups in a Node. 
     '''
+    
+    integrable = True
+    parallelSafe = True
+    
     def __init__(self, group=None, *args, **kwargs):
         
         self.singleGroup = group
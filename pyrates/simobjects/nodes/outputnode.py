@@ -37,6 +37,10 @@ class OutputNode(Node):
         else:
             self.output = None
     
+    def get_next_change(self, timeStep):
+        # No connection is sending from an output node
+        return None
+    
     def check_input(self, timeStep):
         # This function must be overridden in order to check if the input group state allows to generate an output
         pass
@@ -13,6 +13,8 @@ __all__ = ['RecurrentNode']
 
 class RecurrentNode(Node):
     
+    integrable = True
+    parallelSafe = True
     
     def __init__(self,
                  groupClass,
@@ -240,7 +240,15 @@ def generateBlocks(nbTrialsPerBlock=0, blockList=[]):
 ##        return saved_object
 
 class RealTaskNode(Node):
+    '''Base class of the nodes running a task.
     
+    The attributes holding the state of the task (e.g. the current trial, the
+    reward or changeWeightCondition) must be listed in the class attribute
+    checkpointVars of the subclasses to be saved in the checkpoints of the
+    simulation (see Simulation.checkpoint). Numbers, strings and arrays are
+    supported, other states require to override methods _checkpoint_state and
+    _restore_state.
+    '''
     
     def __init__(self,
                  outputNode=None,
@@ -7,12 +7,23 @@ Furthermore, basic information on the objects are saved for results processing.
 """
 
 # Standard imports
+import threading
 import numpy as np
 
 # Local imports
 
 
-__all__ = ["SimulationObject", "MonitoredObject"]
+__all__ = ["SimulationObject", "MonitoredObject", "DecimatedMonitor"]
+
+# Stacks of the simulations used as context with a 'with' statement, one stack
+# per thread
+_simulationContexts = threading.local()
+
+def _get_context_stack():
+    
+    if not hasattr(_simulationContexts, 'stack'):
+        _simulationContexts.stack = []
+    return _simulationContexts.stack
 
 class SimulationObject(object):
     """Base class of all object processed in the neural simulation
@@ -28,13 +39,44 @@ class SimulationObject(object):
     """
     
     # The following variable specifies the Simulation where all the object must
-    # be registered. It is assigned in core.global_methods.
+    # be registered. It is assigned in core.global_methods. The objects created
+    # inside a 'with simulation:' statement are registered in that simulation
+    # instead (see method __new__).
     simulationRef = None
     
+    # Attributes saved in the checkpoints of the simulation, see method
+    # _checkpoint_state
+    checkpointVars = []
+    
     # This variable is a reference for the method add_object method assigned in
     # core.global_methods.
 #    add_object = None
     
+    def __new__(cls, *args, **kwargs):
+        
+        obj = super(SimulationObject, cls).__new__(cls)
+        # The simulation of the innermost 'with' statement of the thread
+        # replaces the default simulation
+        stack = _get_context_stack()
+        if stack:
+            obj.simulationRef = stack[-1]
+        return obj
+    
+    @staticmethod
+    def _enter_simulation(simulation):
+        """Make simulation the simulation of the objects created by the
+        current thread, until _exit_simulation is called."""
+        _get_context_stack().append(simulation)
+    
+    @staticmethod
+    def _exit_simulation(simulation):
+        
+        stack = _get_context_stack()
+        if not stack or stack[-1] is not simulation:
+            raise RuntimeError, 'Simulation contexts must be exited in the '\
+                + 'reverse order of their entry'
+        stack.pop()
+    
     def __init__(self, name=None, register=True, save=True):
         """
         Arguments:
@@ -67,6 +109,29 @@ class SimulationObject(object):
         if save:
             self.simulationRef.savedObjects.append(self)
     
+    def _checkpoint_state(self):
+        """Return the dictionary of the arrays saved for the object by
+        Simulation.checkpoint. By default these are the attributes listed in
+        the class attribute checkpointVars which are not None.
+        """
+        state = {}
+        for var in self.checkpointVars:
+            value = getattr(self, var, None)
+            if value is not None:
+                state[var] = np.asarray(value)
+        return state
+    
+    def _restore_state(self, state):
+        """Set back the arrays returned by _checkpoint_state. Arrays with no
+        dimension are restored as numbers.
+        """
+        for var, value in state.items():
+            if value.ndim == 0:
+                value = value.item()
+            else:
+                value = value.copy()
+            setattr(self, var, value)
+    
     def _saveddata(self):
         """Save object name and class name"""
         savedData = {'name': str(self),
@@ -85,7 +150,8 @@ class MonitoredObject(SimulationObject):
     
     # Number of time steps to increment the monitors when the number of time
     # steps in a simulation is unknown. It can be seen as a buffer extension
-    # to the monitors
+    # to the monitors: the records are kept in a list of chunks of
+    # tsBlockSize time steps, concatenated once when the monitors are closed
     tsBlockSize = 10000
     
     def __init__(self, monitored=False, *args, **kwargs):
@@ -93,6 +159,11 @@ class MonitoredObject(SimulationObject):
         self.isMonitored = monitored
         self.nbTimeStepUnknow = False
         self.monitoredVars = []
+        # (decimation, mode) of the variables not recorded at every time step
+        self.monitorDecimation = {}
+        # Flat indices of the units recorded for the variables not recorded
+        # entirely
+        self.monitorUnits = {}
         super(MonitoredObject, self).__init__(*args, **kwargs)
     
     def _initialize_monitor(self, nbTimeSteps):
@@ -105,16 +176,73 @@ class MonitoredObject(SimulationObject):
                 self.nbTimeSteps = nbTimeSteps
             self.monitorData = {}
             
+            # The monitors have the floating-point type of the simulation
+            dtype = self.simulationRef.dtype
+            # The variables recorded at every time step, the other ones by
+            # their DecimatedMonitor
+            self.recordedVars = [var for var in self.monitoredVars \
+                                 if var not in self.monitorDecimation]
+            self.decimatedMonitors = {}
+            # Positions of the recorded units in the flattened last dimensions
+            # of the values, and the number of these dimensions
+            self.monitorIndices = {}
+            for var, units in self.monitorUnits.items():
+                unitShape, nbDims = self._monitor_units(var)
+                self.monitorIndices[var] = (self._monitor_positions(var, units),
+                                            nbDims)
+            startTimeStep = getattr(self.simulationRef, 'timeStep', 0)
             for var in self.monitoredVars:
-                varShape = list(np.shape(self.__getattribute__(var)))
+                value = self._monitor_record(var)
+                if var in self.monitorDecimation:
+                    decimation, mode = self.monitorDecimation[var]
+                    if self.nbTimeStepUnknow:
+                        nbRecords = None
+                    else:
+                        nbRecords = self.nbTimeSteps
+                    self.decimatedMonitors[var] = DecimatedMonitor(
+                        value, startTimeStep, decimation, mode, nbRecords,
+                        dtype, MonitoredObject.tsBlockSize)
+                    continue
+                varShape = list(np.shape(value))
                 varShape.insert(0, self.nbTimeSteps + 1)
-                self.monitorData[var] = np.zeros(varShape)
-                self.monitorData[var][0] = self.__getattribute__(var)
+                self.monitorData[var] = np.zeros(varShape, dtype)
+                self.monitorData[var][0] = value
             
+            # The full chunks of each monitor, monitorData holding the chunk
+            # being filled, whose first row is the record chunkStart
+            self.monitorChunks = dict([(var, []) for var in self.recordedVars])
+            self.chunkStart = 0
             self.ownTimeStep = 1
     
-    def monitorVars(self, variables=None):
-        '''Method to set the monitored variable of the object'''
+    def monitorVars(self, variables=None, decimation=1, mode='subsample',
+                    units=None):
+        '''Method to set the monitored variable of the object
+        
+        Arguments:
+        - variables: the list of the monitored variables, by default the ones
+            of method default_monitored
+        - decimation: the variables are recorded once every decimation time
+            steps, see DecimatedMonitor. Their records then come with the time
+            steps they correspond to, under the key '<variable> time steps' in
+            the saved data.
+        - mode: how the values of the decimation time steps are reduced to
+            one record, one of 'subsample', 'mean' and 'minmax' (see
+            DecimatedMonitor)
+        - units: the units of the variables recorded, by default all of them:
+            an array of flat indices, a boolean mask, or an array of shape
+            (nbUnits, 2) of (row, column) pairs, in the shape of the group
+            (for the weights of a connection, of the weight matrix). The
+            records then have one element per unit, in the order given, and
+            the (row, column) pair of each unit is saved under the key
+            '<variable> units'.
+        The variables monitored again are recorded with the last decimation,
+        mode and units given.
+        '''
+        if int(decimation) < 1:
+            raise ValueError, 'decimation must be a positive number of time steps'
+        if mode not in DecimatedMonitor.modes:
+            msg = 'mode argument must be one of %s'
+            raise ValueError, msg%str(DecimatedMonitor.modes)
         if not hasattr(self, 'name'):
             msg = 'To monitor an object, its name variable must be defined!'
             raise AttributeError, msg
@@ -135,14 +263,136 @@ class MonitoredObject(SimulationObject):
         for var in variables:
             if var not in self.monitoredVars:
                 self.monitoredVars.append(var)
+            if int(decimation) == 1 and mode == 'subsample':
+                self.monitorDecimation.pop(var, None)
+            else:
+                self.monitorDecimation[var] = (int(decimation), mode)
+            if units is None:
+                self.monitorUnits.pop(var, None)
+            else:
+                self.monitorUnits[var] = self._select_units(var, units)
             
         self.isMonitored = True
-        self.simulationRef.monitoredObjects.append(self)
+        if self not in self.simulationRef.monitoredObjects:
+            self.simulationRef.monitoredObjects.append(self)
+    
+    def _select_units(self, var, units):
+        '''Return the flat indices of the units selected by the argument units
+        of monitorVars for the variable var.
+        '''
+        unitShape = tuple(self._monitor_units(var)[0])
+        size = int(np.prod(unitShape))
+        units = np.asarray(units)
+        if units.dtype == bool:
+            if units.shape != unitShape and units.shape != (size,):
+                msg = 'The mask of the units of %s must have the shape %s'
+                raise ValueError, msg%(var, str(unitShape))
+            return np.flatnonzero(units)
+        if units.dtype.kind not in 'iu':
+            raise TypeError, 'units must be an array of indices or a boolean mask'
+        if units.ndim == 2 and units.shape[1] == len(unitShape):
+            if np.any(units < 0) or np.any(units >= unitShape):
+                raise IndexError, 'The units of %s are out of bounds'%var
+            return np.ravel_multi_index(units.T, unitShape)
+        if units.ndim != 1:
+            msg = 'units must be flat indices or (row, column) pairs in the '\
+                + 'shape %s'
+            raise ValueError, msg%str(unitShape)
+        if np.any(units < -size) or np.any(units >= size):
+            raise IndexError, 'The units of %s are out of bounds'%var
+        return units % size
+    
+    def _monitor_units(self, var):
+        '''Return the shape in which the units of the monitored variable var
+        are selected (see monitorVars, argument units) and the number of last
+        dimensions of its value they span. May be overridden in subclasses,
+        by default all the dimensions of the value.
+        '''
+        shape = np.shape(self._monitor_value(var))
+        return shape, len(shape)
+    
+    def _monitor_positions(self, var, units):
+        '''Return the positions of the units with flat indices units in the
+        flattened last dimensions of the value of the monitored variable var.
+        May be overridden in subclasses whose values do not hold every unit.
+        '''
+        return units
+    
+    def _monitor_record(self, var):
+        '''Return the value of the monitored variable var recorded by its
+        monitor, restricted to its selected units if any.
+        '''
+        value = self._monitor_value(var)
+        if var not in self.monitorIndices:
+            return value
+        positions, nbDims = self.monitorIndices[var]
+        value = np.asarray(value)
+        return value.reshape(value.shape[:value.ndim - nbDims] + (-1,))[..., positions]
     
     def _close_monitors(self):
         
-        for var in self.monitoredVars:
-            self.monitorData[var] = self.monitorData[var][0 : self.ownTimeStep]
+        for var in self.recordedVars:
+            chunks = self.get_monitor_chunks(var)
+            if len(chunks) == 1:
+                self.monitorData[var] = chunks[0]
+            else:
+                self.monitorData[var] = np.concatenate(chunks, axis=0)
+            self.monitorChunks[var] = []
+        self.chunkStart = 0
+        for var, monitor in self.decimatedMonitors.items():
+            self.monitorData[var], self.monitorData[var + ' time steps'] = \
+                monitor.close()
+        self.decimatedMonitors = {}
+    
+    def get_monitor_chunks(self, var):
+        '''Return the list of the arrays holding the successive records of the
+        monitored variable var, without copying them. Their concatenation is
+        the data of the monitor after it is closed.
+        '''
+        if var in self.decimatedMonitors:
+            return self.decimatedMonitors[var].get_chunks()
+        current = self.monitorData[var][0 : self.ownTimeStep - self.chunkStart]
+        return self.monitorChunks[var] + [current]
+    
+    def _monitor_nbytes(self):
+        '''Return the number of bytes allocated by the monitors'''
+        if not self.isMonitored or not hasattr(self, 'monitorData'):
+            return 0
+        nbytes = sum([np.asarray(data).nbytes \
+                      for data in self.monitorData.values()])
+        for chunks in self.monitorChunks.values():
+            nbytes += sum([chunk.nbytes for chunk in chunks])
+        for monitor in self.decimatedMonitors.values():
+            nbytes += monitor.nbytes()
+        return nbytes
+    
+    def _resample_monitors(self, timeSteps, newTimeSteps):
+        '''Linearly interpolate the closed monitors, recorded at the time steps
+        timeSteps, onto the time steps newTimeSteps. The decimated monitors
+        keep their own time steps.
+        '''
+        if not self.isMonitored:
+            return
+        if len(timeSteps) > 1:
+            position = np.searchsorted(timeSteps, newTimeSteps, side='right') - 1
+            position = np.clip(position, 0, len(timeSteps) - 2)
+            weight = np.true_divide(newTimeSteps - timeSteps[position],
+                                    timeSteps[position + 1] - timeSteps[position])
+        for var in self.recordedVars:
+            data = self.monitorData[var]
+            if len(timeSteps) == 1:
+                self.monitorData[var] = data[[0] * len(newTimeSteps)]
+                continue
+            varWeight = weight.reshape((-1,) + (1,) * (data.ndim - 1))
+            self.monitorData[var] = (data[position] + \
+                varWeight * (data[position + 1] - data[position])).astype(data.dtype)
+    
+    def _monitor_value(self, var):
+        '''Return the value of the monitored variable var recorded by the
+        monitors. May be overridden in subclasses, e.g. to record a part of
+        the variable.
+        '''
+        return getattr(self, var)
     
     def monitorable(self):
         '''Return the list of variables monitored by default by the class
@@ -161,19 +411,50 @@ class MonitoredObject(SimulationObject):
                 addedSteps = MonitoredObject.tsBlockSize
                 self._update_nbtimestep(addedSteps)
                 self.nbTimeSteps += addedSteps
-                
-            for var in self.monitoredVars:
-                self.monitorData[var][self.ownTimeStep] = self.__getattribute__(var)
+            
+            row = self.ownTimeStep - self.chunkStart
+            for var in self.recordedVars:
+                self.monitorData[var][row] = self._monitor_record(var)
+            for var, monitor in self.decimatedMonitors.items():
+                monitor.record(self._monitor_record(var), timeStep)
             self.ownTimeStep += 1
             
+    def _repeat_monitoring(self, nbTimeSteps):
+        '''Record the current values of the variables nbTimeSteps times, for
+        time steps skipped by the simulation.
+        '''
+        if self.isMonitored:
+            missingSteps = self.ownTimeStep + nbTimeSteps - 1 - self.nbTimeSteps
+            if missingSteps > 0 and not self.nbTimeStepUnknow:
+                raise ValueError, 'The monitors of %s are full'%str(self)
+            
+            for var, monitor in self.decimatedMonitors.items():
+                monitor.repeat(self._monitor_record(var), nbTimeSteps)
+            
+            # The records may span several chunks
+            while nbTimeSteps > 0:
+                if self.ownTimeStep > self.nbTimeSteps:
+                    addedSteps = MonitoredObject.tsBlockSize
+                    self._update_nbtimestep(addedSteps)
+                    self.nbTimeSteps += addedSteps
+                start = self.ownTimeStep - self.chunkStart
+                nbRows = min(nbTimeSteps, self.nbTimeSteps + 1 - self.ownTimeStep)
+                for var in self.recordedVars:
+                    self.monitorData[var][start : start + nbRows] = \
+                        self._monitor_record(var)
+                self.ownTimeStep += nbRows
+                nbTimeSteps -= nbRows
+    
     def _update_nbtimestep(self, addedTimeSteps):
-        '''Update the number of time steps in the monitors.
-        Must be overridden in subclasses
+        '''Add a chunk of addedTimeSteps time steps to the monitors, once the
+        current chunk is full. The previous records are not copied.
         '''
-        for var in self.monitoredVars:
-            varShape = list(np.shape(self.__getattribute__(var)))
-            varShape.insert(0, addedTimeSteps)
-            self.monitorData[var] = np.concatenate((self.monitorData[var], np.zeros(varShape)), axis=0)
+        self.chunkStart = self.nbTimeSteps + 1
+        for var in self.recordedVars:
+            data = self.monitorData[var]
+            self.monitorChunks[var].append(data)
+            self.monitorData[var] = np.zeros((addedTimeSteps,) + data.shape[1:],
+                                             data.dtype)
     
     def default_monitored(self):
         '''Specify the variables that are monitored by default.
@@ -187,5 +468,140 @@ class MonitoredObject(SimulationObject):
         savedData.update({'monitored vars': self.monitoredVars})
         for var in self.monitoredVars:
             savedData.update({var: self.monitorData[var]})
+            if var + ' time steps' in self.monitorData:
+                savedData[var + ' time steps'] = \
+                    self.monitorData[var + ' time steps']
+            if var in self.monitorUnits:
+                unitShape = self._monitor_units(var)[0]
+                savedData[var + ' units'] = np.transpose(
+                    np.unravel_index(self.monitorUnits[var], unitShape))
         
         return savedData
+
+class DecimatedMonitor(object):
+    '''Monitor of a variable recording one value every decimation time steps,
+    used by MonitoredObject for the variables monitored with a decimation.
+    
+    Arguments:
+    - value: the value of the variable when the monitoring starts, the first
+        record
+    - timeStep: the time step of the first record
+    - decimation: the number of time steps reduced to one record
+    - mode: the reduction of the values of the decimation time steps:
+        - 'subsample': the value at the last time step
+        - 'mean': the mean of the values
+        - 'minmax': the minimum and the maximum of the values, the first
+            and second elements of a dimension added after the time dimension
+    - nbRecords: the number of time steps recorded, or None if it is unknown
+    - dtype: the floating-point type of the records
+    - chunkSize: the number of records allocated at once when nbRecords is
+        unknown
+    
+    Each record comes with the last time step it covers. With an adaptive
+    integrator, a record covers decimation steps of the integrator. When the
+    monitor is closed, the time steps of an incomplete window are recorded in
+    modes 'mean' and 'minmax', and dropped in mode 'subsample'.
+    '''
+    
+    modes = ['subsample', 'mean', 'minmax']
+    
+    def __init__(self, value, timeStep, decimation, mode, nbRecords, dtype,
+                 chunkSize):
+        
+        self.decimation = decimation
+        self.mode = mode
+        recordShape = np.shape(value)
+        if mode == 'minmax':
+            recordShape = (2,) + recordShape
+        if nbRecords is None:
+            self.chunkSize = chunkSize
+        else:
+            # The first record, the complete windows and an incomplete one
+            self.chunkSize = nbRecords // decimation + 2
+        self.chunks = []
+        self.data = np.zeros((self.chunkSize,) + recordShape, dtype)
+        self.data[0] = value
+        self.timeSteps = [timeStep]
+        self.row = 1
+        # Reduction of the values of the current window
+        self.window = np.zeros(recordShape, dtype)
+        self.count = 0
+        self.lastTimeStep = timeStep
+    
+    def record(self, value, timeStep):
+        '''Record the value of the variable at timeStep'''
+        self.count += 1
+        self.lastTimeStep = timeStep
+        if self.mode == 'mean':
+            if self.count == 1:
+                self.window[...] = value
+            else:
+                self.window += value
+        elif self.mode == 'minmax':
+            if self.count == 1:
+                self.window[...] = value
+            else:
+                np.minimum(self.window[0], value, out=self.window[0])
+                np.maximum(self.window[1], value, out=self.window[1])
+        if self.count == self.decimation:
+            self._end_window(value)
+    
+    def repeat(self, value, nbTimeSteps):
+        '''Record the same value for the nbTimeSteps time steps following the
+        last one recorded.'''
+        while nbTimeSteps > 0:
+            nbValues = min(nbTimeSteps, self.decimation - self.count)
+            if self.mode == 'mean':
+                if self.count == 0:
+                    self.window[...] = value
+                    self.window *= nbValues
+                else:
+                    self.window += nbValues * np.asarray(value)
+            elif self.mode == 'minmax':
+                if self.count == 0:
+                    self.window[...] = value
+                else:
+                    np.minimum(self.window[0], value, out=self.window[0])
+                    np.maximum(self.window[1], value, out=self.window[1])
+            self.count += nbValues
+            self.lastTimeStep += nbValues
+            nbTimeSteps -= nbValues
+            if self.count == self.decimation:
+                self._end_window(value)
+    
+    def _end_window(self, value):
+        '''Add the record of the current window'''
+        if self.row == len(self.data):
+            self.chunks.append(self.data)
+            self.data = np.zeros((self.chunkSize,) + self.data.shape[1:],
+                                 self.data.dtype)
+            self.row = 0
+        if self.mode == 'subsample':
+            self.data[self.row] = value
+        elif self.mode == 'mean':
+            np.divide(self.window, self.count, out=self.data[self.row])
+        else:
+            self.data[self.row] = self.window
+        self.row += 1
+        self.timeSteps.append(self.lastTimeStep)
+        self.count = 0
+    
+    def get_chunks(self):
+        '''Return the list of the arrays holding the records, without copying
+        them.'''
+        return self.chunks + [self.data[0 : self.row]]
+    
+    def nbytes(self):
+        
+        return sum([chunk.nbytes for chunk in self.chunks]) + self.data.nbytes
+    
+    def close(self):
+        '''Return the records and their time steps as arrays'''
+        if self.count > 0 and self.mode != 'subsample':
+            self._end_window(None)
+        chunks = self.get_chunks()
+        if len(chunks) == 1:
+            data = chunks[0]
+        else:
+            data = np.concatenate(chunks, axis=0)
+        return data, np.array(self.timeSteps)
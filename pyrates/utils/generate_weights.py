@@ -82,7 +82,10 @@ def generateRandomWeights(nbUnitsIN=1,
 
 
 def convolutionMask(layerShape=None, mask=None):
-    
+    '''Generate the weight matrix of the 2D convolution of a layer with the
+    shape layerShape by the mask. See also ConvolutionConnection, computing the
+    same convolution without the weight matrix.
+    '''
     nbUnits = layerShape[0] * layerShape[1]
     weight_matrix = np.zeros((nbUnits,nbUnits))
     if mask.shape[0] % 2 != 1 or mask.shape[1] % 2 != 1:
@@ -0,0 +1,103 @@
+"""Each instance of a batched simulation must give the outputs of the same
+network simulated alone, on all the engines and integrators.
+"""
+import unittest
+import numpy as np
+
+from pyrates.core.simulation import Simulation
+from pyrates.simobjects.groups import IdentityGroup, LeakyIntegrator
+from pyrates.simobjects.nodes import StaticInput
+from pyrates.simobjects.connections import Connection
+from pyrates.utils import Tanh
+
+TAUS = np.array([4., 7., 11.])
+
+def build_and_run(instance=None, steadyState=None, attributes={}, **runArgs):
+    '''Build a small recurrent network with delayed connections, run it and
+    return the outputs of its two groups, of shape (timeSteps, batchSize,
+    nbUnits). Without instance, the network is batched with one time constant
+    of the first group per instance, else it is the given instance alone.
+    '''
+    with Simulation() as sim:
+        if instance is None:
+            sim.set_batch_size(len(TAUS))
+            tau = TAUS
+        else:
+            tau = TAUS[instance]
+        for name, value in attributes.items():
+            setattr(sim, name, value)
+        rng = np.random.RandomState(0)
+        inputs = np.zeros((300, 6))
+        inputs[:100] = rng.rand(6)
+        inputs[150:] = rng.rand(6)
+        inp = StaticInput(inputs, groupClass=IdentityGroup, name='inp')
+        g1 = LeakyIntegrator(name='g1', nbUnits=10, tau=tau,
+                             activationClass=Tanh)
+        g2 = LeakyIntegrator(name='g2', nbUnits=7, tau=8.,
+                             activationClass=Tanh)
+        connections = [
+            Connection(inp, g1, weightMatrix=rng.rand(10, 6), name='a'),
+            Connection(inp, g2, weightMatrix=rng.rand(7, 6), name='b'),
+            Connection(g1, g2, weightMatrix=rng.rand(7, 10)*0.3, name='c'),
+            Connection(g2, g1, weightMatrix=rng.rand(10, 7)*0.3, name='d')]
+        for connection, delay in zip(connections, [3, 0, 2, 1]):
+            if delay:
+                connection.delay = delay
+        g1.monitorVars(['output'])
+        g2.monitorVars(['output'])
+        if steadyState is not None:
+            sim.set_steady_state_detection(**steadyState)
+        sim.set_save_folder(None)
+        sim.run(deltat=1.0, **runArgs)
+        data = sim.savedData.values()[0]
+    outputs = [data[name]['output'] for name in ['g1', 'g2']]
+    return np.concatenate([output.reshape(len(output), -1, output.shape[-1])
+                           for output in outputs], axis=-1)
+
+class BatchTestCase(unittest.TestCase):
+
+    def check_instances(self, tolerance=1e-12, **kwargs):
+
+        batch = build_and_run(**kwargs)
+        for instance in range(len(TAUS)):
+            single = build_and_run(instance=instance, **kwargs)
+            self.assertEqual(batch.shape[0], single.shape[0])
+            self.assertLess(np.abs(batch[:, instance] - single[:, 0]).max(),
+                            tolerance)
+
+    def test_loop(self):
+
+        self.check_instances()
+
+    def test_state_slab(self):
+
+        self.check_instances(stateSlab=True)
+
+    def test_heun(self):
+
+        self.check_instances(integrator='heun')
+
+    def test_rk4(self):
+
+        self.check_instances(integrator='rk4')
+
+    def test_adaptive(self):
+        # The steps are shared by the instances of a batch, the outputs are
+        # compared at each time step within the tolerance of the integrator
+        self.check_instances(integrator='adaptive', tolerance=1e-6,
+                             attributes={'resampleMonitors': True,
+                                         'adaptiveTolerance': 1e-8})
+
+    def test_steady_state(self):
+
+        self.check_instances(steadyState={'tolerance': 1e-9,
+                                          'nbTimeSteps': 10,
+                                          'action': 'skip'})
+
+    def test_compiled(self):
+
+        self.check_instances(engine='compiled', stateSlab=True,
+                             fuseConnections=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""The updates of the weights of DAModulatedConnection must give the weights
+of the original loop over the columns, including when the weights are
+replaced by the new weights between the updates.
+"""
+import unittest
+import numpy as np
+
+from pyrates.core.simulation import Simulation
+from pyrates.simobjects.groups import LeakyIntegrator
+from pyrates.simobjects.connections import DAModulatedConnection
+from pyrates.utils import Tanh
+
+def loop_update(weights, recActivity, sendActivity, coefficient):
+    '''The original rule, one column at a time'''
+    FiFjProduct = np.dot(recActivity.reshape(-1, 1),
+                         sendActivity.reshape(1, -1)) * (weights != 0)
+    newWeights = weights + coefficient * FiFjProduct
+    newWeights = newWeights * (newWeights > 0) * (newWeights < 1) + \
+        (newWeights >= 1) * 1
+    for j in range(newWeights.shape[0]):
+        newWeights[:, j] = newWeights[:, j] * np.sum(newWeights[:, j]) / \
+            np.sum(weights[:, j])
+    return newWeights
+
+class Task(object):
+    reward = True
+    changeWeightCondition = False
+
+class DAModulatedConnectionTestCase(unittest.TestCase):
+
+    nbUpdates = 20
+
+    def make_connection(self, weights, batchSize=None):
+
+        with Simulation() as sim:
+            if batchSize is not None:
+                sim.set_batch_size(batchSize)
+            sending = LeakyIntegrator(name='sending', nbUnits=weights.shape[-1],
+                                      tau=5., activationClass=Tanh)
+            receiving = LeakyIntegrator(name='receiving',
+                                        nbUnits=weights.shape[-2], tau=4.,
+                                        activationClass=Tanh)
+            connection = DAModulatedConnection(sendingObj=sending,
+                                               receivingObj=receiving,
+                                               weightMatrix=weights,
+                                               taskNode=Task(), C1=0.2,
+                                               inputThreshold=1., name='da')
+            connection._initialize()
+        return connection
+
+    def test_update_weights(self):
+
+        rng = np.random.RandomState(0)
+        weights = rng.rand(8, 12) * (rng.rand(8, 12) < 0.8)
+        connection = self.make_connection(weights)
+        expected = connection.weights.copy()
+        for update in range(self.nbUpdates):
+            reward = rng.rand() < 0.5
+            connection.recGrpActivity = rng.rand(8)
+            connection.sendGrpActivity = rng.rand(12)
+            connection._update_weights(reward)
+            coefficient = connection.C1 * (connection.posReinforcement if reward
+                                           else connection.negReinforcement)
+            expected = loop_update(expected, connection.recGrpActivity,
+                                   connection.sendGrpActivity, coefficient)
+            np.testing.assert_allclose(connection.newWeights, expected,
+                                       rtol=1e-12, atol=1e-12)
+            # The weights are replaced between the trials
+            connection.weights = connection.newWeights
+        # Some weights were set to zero by the updates
+        self.assertFalse(np.any(np.isnan(expected)))
+        self.assertGreater(np.sum(expected == 0), np.sum(weights == 0))
+
+    def test_batch_update_weights(self):
+
+        batchSize = 3
+        rng = np.random.RandomState(2)
+        weights = rng.rand(batchSize, 8, 12) * \
+            (rng.rand(batchSize, 8, 12) < 0.8)
+        connection = self.make_connection(weights, batchSize)
+        expected = connection.weights.copy()
+        for update in range(self.nbUpdates):
+            reward = rng.rand(batchSize) < 0.5
+            condition = rng.rand(batchSize) < 0.7
+            connection.recGrpActivity = rng.rand(batchSize, 8)
+            connection.sendGrpActivity = rng.rand(batchSize, 12)
+            connection.newWeights = connection.weights
+            connection._batch_update_weights(reward, condition)
+            for instance in range(batchSize):
+                if not condition[instance]:
+                    continue
+                coefficient = connection.C1 * np.where(
+                    reward[instance], connection.posReinforcement,
+                    connection.negReinforcement)
+                expected[instance] = loop_update(
+                    expected[instance], connection.recGrpActivity[instance],
+                    connection.sendGrpActivity[instance], coefficient)
+            np.testing.assert_allclose(connection.newWeights, expected,
+                                       rtol=1e-12, atol=1e-12)
+            connection.weights = connection.newWeights
+        self.assertFalse(np.any(np.isnan(expected)))
+        self.assertGreater(np.sum(expected == 0), np.sum(weights == 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""The adaptive integrator must follow the fixed step integrators, including
+when a change of the input reaches the integrated groups through a delayed
+connection.
+"""
+import unittest
+import numpy as np
+
+from pyrates.core.simulation import Simulation
+from pyrates.simobjects.groups import IdentityGroup, LeakyIntegrator
+from pyrates.simobjects.nodes import StaticInput
+from pyrates.simobjects.connections import Connection
+from pyrates.utils import Tanh
+
+def run_step_input(integrator, delay, **attributes):
+    '''Run a leaky integrator receiving, through a connection delayed by delay
+    time steps, an input stepping from 0 to 1 at time step 201, and return
+    its output at each time step.
+    '''
+    with Simulation() as sim:
+        for name, value in attributes.items():
+            setattr(sim, name, value)
+        inputs = np.zeros((400, 4))
+        inputs[200:] = 1.
+        inp = StaticInput(inputs, groupClass=IdentityGroup, name='inp')
+        group = LeakyIntegrator(name='group', nbUnits=5, tau=10.,
+                                activationClass=Tanh)
+        connection = Connection(inp, group, name='delayed',
+                                weightMatrix=np.linspace(0.1, 0.5, 20).reshape(5, 4))
+        if delay:
+            connection.delay = delay
+        group.monitorVars(['output'])
+        sim.set_save_folder(None)
+        sim.run(deltat=1.0, integrator=integrator)
+        data = sim.savedData.values()[0]
+    return data['group']['output'].reshape(400, -1)
+
+class AdaptiveIntegratorTestCase(unittest.TestCase):
+
+    def check_step_input(self, delay):
+
+        heun = run_step_input('heun', delay)
+        adaptive = run_step_input('adaptive', delay, resampleMonitors=True,
+                                  maxStepLength=50)
+        self.assertLess(np.abs(adaptive - heun).max(), 0.01)
+
+    def test_step_input(self):
+
+        self.check_step_input(0)
+
+    def test_delayed_step_input(self):
+
+        for delay in [1, 3, 7]:
+            self.check_step_input(delay)
+
+if __name__ == '__main__':
+    unittest.main()